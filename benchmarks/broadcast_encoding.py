@@ -0,0 +1,66 @@
+"""CPU cost of encoding a room broadcast, per message, against room size.
+
+Run with `python3 benchmarks/broadcast_encoding.py`.
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from server.frames import Frame  # noqa: E402
+
+ROOM_SIZES = (1, 10, 100, 1000)
+MESSAGES = 200
+CONTENT = "hello world " * 20
+AUTHOR = {"name": "someone", "tag": 1, "id": 1}
+
+
+def per_socket(size: int) -> None:
+    """Encode the frame again for every recipient, like SocketHandshake.reply and WebSocket.send_json did."""
+    for _ in range(size):
+        json.dumps(
+            {
+                "type": "roomconnect",
+                "done": False,
+                "message": "New message received.",
+                "success": True,
+                "new": {"author": AUTHOR, "content": CONTENT},
+            },
+            separators=(",", ":"),
+        )
+
+
+def encode_once(size: int) -> None:
+    """Encode the frame once and render it for every recipient."""
+    frame = Frame.encode(
+        message="New message received.",
+        payload={"new": {"author": AUTHOR, "content": CONTENT}},
+    )
+
+    for _ in range(size):
+        frame.render("roomconnect")
+
+
+def measure(fn, size: int) -> float:
+    """Average CPU time of a broadcast to `size` sockets, in microseconds."""
+    start = time.process_time()
+
+    for _ in range(MESSAGES):
+        fn(size)
+
+    return (time.process_time() - start) / MESSAGES * 1_000_000
+
+
+def main() -> None:
+    """Print the cost of both strategies for every room size."""
+    print(f"{'room size':>10} {'per socket (us)':>16} {'encode once (us)':>17}")
+
+    for size in ROOM_SIZES:
+        print(
+            f"{size:>10} {measure(per_socket, size):>16.1f} {measure(encode_once, size):>17.1f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
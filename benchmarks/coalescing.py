@@ -0,0 +1,83 @@
+"""Server CPU time and frames sent per room event, with and without coalescing.
+
+Every event in a burst is either sent as its own frame, or collected into
+one batch frame per burst, like `RoomManager` does with a coalescing window.
+Sending is approximated by the permessage-deflate compression that runs for
+every frame sent to every connection.
+
+Run with `python3 benchmarks/coalescing.py`.
+"""
+import sys
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from server.frames import Frame  # noqa: E402
+
+ROOM_SIZE = 100
+EVENTS = 2000
+BURSTS = (1, 10, 50)
+AUTHOR = {"name": "someone", "tag": 1, "id": 1}
+
+
+def event(i: int) -> dict:
+    """Build the payload of the i-th new message event."""
+    return {"new": {"author": AUTHOR, "content": f"message number {i}", "seq": i}}
+
+
+def send(compressors: list, frame: Frame) -> None:
+    """Compress a frame for every connection, like permessage-deflate would."""
+    rendered = frame.render("roomconnect")
+    assert isinstance(rendered, str)
+    data = rendered.encode()
+
+    for i in compressors:
+        i.compress(data)
+        i.flush(zlib.Z_SYNC_FLUSH)
+
+
+def singles(burst: int, compressors: list) -> int:
+    """Send every event as its own frame, returning the number of frames."""
+    for i in range(EVENTS):
+        send(compressors, Frame.encode(message="New message received.", payload=event(i)))
+
+    return EVENTS
+
+
+def batched(burst: int, compressors: list) -> int:
+    """Send every burst as one batch frame, returning the number of frames."""
+    frames = 0
+
+    for start in range(0, EVENTS, burst):
+        events = [event(i) for i in range(start, min(start + burst, EVENTS))]
+        send(compressors, Frame.encode(message="New events received.", payload={"batch": events}))
+        frames += 1
+
+    return frames
+
+
+def measure(fn, burst: int) -> tuple:
+    """Events per CPU second and frames sent for a strategy."""
+    compressors = [zlib.compressobj(wbits=-15) for _ in range(ROOM_SIZE)]
+    start = time.process_time()
+    frames = fn(burst, compressors)
+    elapsed = time.process_time() - start
+    return EVENTS / elapsed, frames * ROOM_SIZE
+
+
+def main() -> None:
+    """Compare both strategies for every burst size."""
+    print(f"{ROOM_SIZE} connections, {EVENTS} events")
+    print(f"{'burst':>6} {'singles (events/s)':>19} {'batched (events/s)':>19} {'frames':>16}")
+
+    for burst in BURSTS:
+        single_rate, single_frames = measure(singles, burst)
+        batch_rate, batch_frames = measure(batched, burst)
+        print(
+            f"{burst:>6} {single_rate:>19.0f} {batch_rate:>19.0f} {single_frames:>7} -> {batch_frames:<6}",
+        )
+
+
+if __name__ == "__main__":
+    main()
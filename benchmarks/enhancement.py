@@ -0,0 +1,90 @@
+"""Client latency of enhancing a message, before and after sharing the analysis.
+
+Before, every enhancer loaded the full model and analysed the message again
+on each call, and owoify built a new Matcher every time. After, the enhancers
+share one pipeline without the parser, only run the components they need,
+reuse cached analyses of repeated messages and a precompiled Matcher.
+
+Requires the client dependencies and the `en_core_web_sm` model.
+Run with `python3 benchmarks/enhancement.py`.
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+import spacy
+from spacy.matcher import Matcher
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "client"))
+from enhancers.match_pattern import PATTERNS_FILE  # noqa: E402
+from enhancers.message_processer import (  # noqa: E402
+    AutoCorrecter, AutoTranslater
+)
+from enhancers.pipeline import pipeline  # noqa: E402
+from enhancers.translations import boomhauer, pig_latin  # noqa: E402
+
+ROUNDS = 200
+MESSAGES = (
+    "hey, did you have a look at the new build?",
+    "I was in Paris with Alice last week, the Eiffel Tower was closed.",
+    "lol",
+    "Does anyone know if Microsoft is hiring in Berlin this year?",
+    "hey, did you have a look at the new build?",
+    "lol",
+)
+OWOIFY_PATTERNS = json.loads(PATTERNS_FILE.read_text())["owoify"]
+
+
+def legacy_owoify(nlp: spacy.Language, doc: spacy.tokens.doc.Doc) -> None:
+    """Build a matcher and owoify a message like owoify used to on every call."""
+    matcher = Matcher(nlp.vocab)
+
+    for pattern in OWOIFY_PATTERNS:
+        matcher.add(pattern["name"], [pattern["pattern"]])
+
+    matcher(doc)
+    "".join(token.text.lower().replace("l", "w") + token.whitespace_ for token in doc)
+
+
+def before(nlp: spacy.Language, message: str) -> None:
+    """Enhance a message with every transform the old way."""
+    legacy_owoify(nlp, nlp(message))
+    boomhauer.boomhauer(nlp(message))
+    pig_latin.pig_latin(nlp(message))
+    nlp(message).ents
+
+
+def after(translater: AutoTranslater, correcter: AutoCorrecter, message: str) -> None:
+    """Enhance a message with every transform through the shared pipeline."""
+    translater.auto_translate_to_owoify(message)
+    translater.auto_translate_to_boomhauer(message)
+    translater.auto_translate_to_pig_latin(message)
+    correcter._analyse(message).ents
+
+
+def measure(fn, *args) -> float:
+    """Average time taken to enhance a message, in seconds."""
+    start = time.perf_counter()
+
+    for _ in range(ROUNDS):
+        for message in MESSAGES:
+            fn(*args, message)
+
+    return (time.perf_counter() - start) / (ROUNDS * len(MESSAGES))
+
+
+def main() -> None:
+    """Compare enhancement latency before and after."""
+    nlp = spacy.load("en_core_web_sm")
+    pipeline.nlp
+    old = measure(before, nlp)
+    new = measure(after, AutoTranslater(), AutoCorrecter())
+
+    print(f"{len(MESSAGES)} messages, {ROUNDS} rounds")
+    print(f"before: {old * 1e3:.2f} ms/message")
+    print(f"after:  {new * 1e3:.2f} ms/message ({pipeline.hits} cache hits, {pipeline.misses} misses)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Event loop lag while a burst of logins verifies passwords.
+
+Run with `python3 benchmarks/login_storm.py [logins]`.
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from argon2 import PasswordHasher
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from server.passwords import PasswordPool  # noqa: E402
+
+LOGINS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+PASSWORD = "correct horse battery staple"
+
+
+async def watch_lag(results: list, done: asyncio.Event) -> None:
+    """Measure how late a 1ms sleep wakes up, like a delivery task would."""
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        results.append(time.perf_counter() - start - 0.001)
+
+
+async def storm(verify) -> float:
+    """Run every login at once, returning the worst event loop lag in milliseconds."""
+    lags: list = []
+    done = asyncio.Event()
+    watcher = asyncio.create_task(watch_lag(lags, done))
+
+    await asyncio.gather(*[verify() for _ in range(LOGINS)])
+    done.set()
+    await watcher
+
+    return max(lags) * 1000 if lags else 0.0
+
+
+async def main() -> None:
+    """Compare verifying passwords on the event loop with the password pool."""
+    hasher = PasswordHasher()
+    hashed = hasher.hash(PASSWORD)
+    pool = PasswordPool(max_pending=LOGINS)
+
+    async def inline() -> None:
+        hasher.verify(hashed, PASSWORD)
+
+    async def pooled() -> None:
+        await pool.verify(hashed, PASSWORD)
+
+    print(f"{LOGINS} logins, worst event loop lag:")
+    print(f"  on the event loop: {await storm(inline):.1f}ms")
+    print(f"  password pool:     {await storm(pooled):.1f}ms")
+    pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
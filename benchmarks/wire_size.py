@@ -0,0 +1,61 @@
+"""Bytes on the wire per room broadcast for each codec, with and without permessage-deflate.
+
+Run with `python3 benchmarks/wire_size.py`.
+"""
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from server.codec import JSON, MsgpackCodec  # noqa: E402
+from server.frames import Frame  # noqa: E402
+
+MESSAGES = 1000
+CONTENTS = ("hi", "how is everyone doing today?", "lol " * 10, "I'll tell you what, man. " * 4)
+
+
+def frames():
+    """Yield a broadcast frame for every message."""
+    for i in range(MESSAGES):
+        yield Frame.encode(
+            message="New message received.",
+            payload={
+                "new": {
+                    "author": {"name": f"user{i % 7}", "tag": i % 3 + 1, "id": i % 7 + 1},
+                    "content": CONTENTS[i % len(CONTENTS)],
+                    "seq": i + 1,
+                },
+            },
+        )
+
+
+def measure(codec) -> tuple:
+    """Average bytes per message with a codec, raw and with permessage-deflate."""
+    raw = 0
+    deflated = 0
+    # permessage-deflate keeps the compression context between messages
+    compressor = zlib.compressobj(wbits=-15)
+
+    for frame in frames():
+        data = frame.render("roomconnect", codec)
+
+        if isinstance(data, str):
+            data = data.encode()
+
+        raw += len(data)
+        deflated += len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+
+    return raw / MESSAGES, deflated / MESSAGES
+
+
+def main() -> None:
+    """Print the wire size of every codec."""
+    print(f"{'codec':>10} {'bytes/message':>14} {'with deflate':>13}")
+
+    for name, codec in (("json", JSON), ("msgpack", MsgpackCodec())):
+        raw, deflated = measure(codec)
+        print(f"{name:>10} {raw:>14.1f} {deflated:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,16 @@
-from typing import Dict, List
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import spacy
+from spacy.matcher import Matcher
+from spacy.tokens.doc import Doc
+
+__all__ = ("MatchPattern", "PatternRegistry", "patterns")
+
+# Patterns shipped with the client, by translation.
+PATTERNS_FILE = Path(__file__).parent / "patterns.json"
 
 
 class MatchPattern:
@@ -8,3 +20,90 @@ class MatchPattern:
         self.name = name
         self.pattern = pattern
         self.replacement = replacement
+
+
+class PatternRegistry:
+    """Match patterns of every translation, compiled into one shared Matcher.
+
+    The Matcher is built once when the pipeline loads (see `compile`), so
+    translations only have to run it. Registering a pattern afterwards
+    rebuilds it on the next match.
+    """
+
+    def __init__(self):
+        self._patterns: Dict[str, List[MatchPattern]] = {}
+        self._names: Dict[str, str] = {}
+        self._matcher: Optional[Matcher] = None
+        self._vocab: Optional[spacy.vocab.Vocab] = None
+        # patterns and their translation, by match ID
+        self._ids: Dict[int, Tuple[str, MatchPattern]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, translation: str, pattern: MatchPattern) -> None:
+        """Add a pattern to a translation."""
+        with self._lock:
+            owner = self._names.get(pattern.name)
+
+            if owner and owner != translation:
+                raise ValueError(f"Pattern {pattern.name} is already used by {owner}.")
+
+            self._names[pattern.name] = translation
+            self._patterns.setdefault(translation, []).append(pattern)
+            self._matcher = None
+
+    def load(self, path: Path) -> None:
+        """Register every pattern in a JSON file.
+
+        The file maps translation names to lists of patterns, each with a
+        `name`, a spaCy `pattern` and a `replacement`.
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        for translation, items in data.items():
+            for item in items:
+                self.register(translation, MatchPattern(**item))
+
+    def compile(self, vocab: spacy.vocab.Vocab) -> Tuple[Matcher, Dict[int, Tuple[str, MatchPattern]]]:
+        """Build the shared Matcher for a vocab, returning it with the patterns by match ID."""
+        with self._lock:
+            matcher = Matcher(vocab)
+            ids: Dict[int, Tuple[str, MatchPattern]] = {}
+
+            for translation, patterns in self._patterns.items():
+                for pattern in patterns:
+                    matcher.add(pattern.name, [pattern.pattern])
+                    ids[vocab.strings.add(pattern.name)] = (translation, pattern)
+
+            self._vocab = vocab
+            self._ids = ids
+            self._matcher = matcher
+
+        return matcher, ids
+
+    def matches(self, doc: Doc, translation: str) -> List[Tuple[MatchPattern, int, int]]:
+        """Find the patterns of a translation in a doc.
+
+        Returns the matched pattern with the start and end index of each match.
+        """
+        with self._lock:
+            matcher, ids = self._matcher, self._ids
+
+        if matcher is None or self._vocab is not doc.vocab:
+            matcher, ids = self.compile(doc.vocab)
+
+        result: List[Tuple[MatchPattern, int, int]] = []
+
+        for match_id, start, end in matcher(doc):
+            owner, pattern = ids[match_id]
+
+            if owner == translation:
+                result.append((pattern, start, end))
+
+        return result
+
+
+patterns = PatternRegistry()
+"""Patterns of every translation."""
+
+patterns.load(PATTERNS_FILE)
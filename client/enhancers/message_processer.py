@@ -1,24 +1,21 @@
 import random
 import re
 import string
-from pathlib import Path
 
 import spacy
-from spacy.matcher import Matcher
 
+from .pipeline import ENTITIES, TAGGING, pipeline
 from .translations import boomhauer, emojify, owoify, pig_latin
+from .word_lists import word_lists
 
 
 class AutoTranslater:
     """Use natural language processing to analyze the message and obscure the text."""
 
     def __init__(self):
-        # Create the nlp object using a small English pipeline trained on written
-        # web text, like blogs, news, and comments.
-        self.nlp: spacy.Language = spacy.load("en_core_web_sm")
-
-        # Initialize the matcher with the shared vocab
-        self.matcher: spacy.matcher.Matcher = Matcher(self.nlp.vocab)
+        # The spaCy pipeline is shared with the other enhancers and loaded on first use.
+        # Translations only need part of speech tags and lemmas.
+        self.pipeline = pipeline
 
         # List of translations
         self.translations = [
@@ -52,28 +49,32 @@ class AutoTranslater:
 
         return new_message
 
+    def _analyse(self, message: str) -> spacy.tokens.doc.Doc:
+        """Analyse the message once, sharing the result between translations."""
+        return self.pipeline.parse(message, TAGGING)
+
     def no_translate(self, message: str):
         """Don't translate and just return the message as is."""
         return message
 
     def auto_translate_to_boomhauer(self, message: str):
         """Translate to Boomhauer."""
-        doc: spacy.tokens.doc.Doc = self.nlp(message)
+        doc: spacy.tokens.doc.Doc = self._analyse(message)
         return boomhauer.boomhauer(doc)
 
     def auto_translate_to_emojify(self, message: str):
         """Translate to Boomhauer."""
-        doc: spacy.tokens.doc.Doc = self.nlp(message)
+        doc: spacy.tokens.doc.Doc = self._analyse(message)
         return emojify.emojify(doc)
 
     def auto_translate_to_owoify(self, message: str):
         """Translate to Boomhauer."""
-        doc: spacy.tokens.doc.Doc = self.nlp(message)
-        return owoify.owoify(self.nlp, doc)
+        doc: spacy.tokens.doc.Doc = self._analyse(message)
+        return owoify.owoify(doc)
 
     def auto_translate_to_pig_latin(self, message: str):
         """Translate to Boomhauer."""
-        doc: spacy.tokens.doc.Doc = self.nlp(message)
+        doc: spacy.tokens.doc.Doc = self._analyse(message)
         return pig_latin.pig_latin(doc)
 
 
@@ -81,12 +82,9 @@ class AutoCorrecter:
     """Use natural language processing to analyze the message and obscure the text."""
 
     def __init__(self):
-        # Create the nlp object using a small English pipeline trained on written
-        # web text, like blogs, news, and comments.
-        self.nlp: spacy.Language = spacy.load("en_core_web_sm")
-
-        # Merge named entities into a single token.
-        self.nlp.add_pipe("merge_entities")
+        # The spaCy pipeline is shared with the other enhancers and loaded on first use.
+        # Autocorrecting only needs named entities.
+        self.pipeline = pipeline
 
         # List of all autocorrecting methods.
         self.autocorrect_methods = [
@@ -138,15 +136,26 @@ class AutoCorrecter:
             self.autocorrect_entities.__name__: 10,
         }
 
+        # Methods that need the spaCy pipeline, too slow when a message has to be sent right away.
+        self.analysing_methods = {self.autocorrect_entities.__name__}
+
     def no_autocorrect(self, message: str) -> str:
         """Don't autocorrect and just return the message as is."""
         return message
 
-    def random_autocorrect(self, message: str) -> str:
-        """Randomly autocorrect a message."""
+    def random_autocorrect(self, message: str, analyse: bool = True) -> str:
+        """
+        Randomly autocorrect a message.
+
+        Methods that analyse the message are skipped if `analyse` is False.
+        """
+        methods = self.autocorrect_methods
+        if not analyse:
+            methods = [method for method in methods if method.__name__ not in self.analysing_methods]
+
         # Choose a random autocorrecter based on their weight values
         random_autocorrect_method = random.choices(
-            self.autocorrect_methods, self.weights.values()
+            methods, [self.weights[method.__name__] for method in methods]
         )[0]
         new_message = random_autocorrect_method(message)
 
@@ -158,48 +167,31 @@ class AutoCorrecter:
 
         return new_message
 
+    def _analyse(self, message: str) -> spacy.tokens.doc.Doc:
+        """Analyse the message once, sharing the result with other calls."""
+        return self.pipeline.parse(message, ENTITIES)
+
     def autocorrect_entities(self, message: str) -> str:
         """Autocorrect message by replacing entities."""
-        doc: spacy.tokens.doc.Doc = self.nlp(message)
-        token_list = [token.text for token in doc]
+        doc: spacy.tokens.doc.Doc = self._analyse(message)
 
         # Replace predicted entities in messages with another random entity in the same category.
+        # Everything between entities (including whitespace) is kept from the original message.
+        pieces = []
+        last = 0
         for ent in doc.ents:
-            random_entity = self._get_random_entity(ent.label_, ent.text)
-            token_list[ent.start: ent.end] = [random_entity]
-
-        # Keep whitespaces from the original message.
-        autocorrected_message = ""
-        for i in range(len(token_list)):
-            autocorrected_message += token_list[i] + doc[i].whitespace_
-        return autocorrected_message
-
-    def _get_random_line(self, entity_label: str):
-        """Get a random line from the entity file."""
-        file_path = (
-            Path(__file__).parent / "word-lists" / f"{entity_label.lower()}s.txt"
-        )
-        all_lines = open(file_path).read().splitlines()
-        line = random.choice(all_lines)
-        return line
+            pieces.append(message[last: ent.start_char])
+            pieces.append(self._get_random_entity(ent.label_, ent.text))
+            last = ent.end_char
+        pieces.append(message[last:])
+        return "".join(pieces)
 
     def _get_random_entity(self, entity_label: str, entity_text: str) -> str:
         """Get a random entity in the same category."""
-        entity_list = [
-            "EVENT",
-            "FAC",
-            "GPE",
-            "LANGAUGE",
-            "LOC",
-            "NORP",
-            "ORG",
-            "PERSON",
-            "PRODUCT",
-            "WORK_OF_ART",
-        ]
-        if entity_label in entity_list:
-            return self._get_random_line(entity_label)
-        return entity_text
+        random_entity = word_lists.sample(entity_label)
+        if random_entity is None:
+            return entity_text
+        return random_entity
 
     def lowercase(self, message: str) -> str:
         """Make message all lowercase."""
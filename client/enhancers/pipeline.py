@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import spacy
+from spacy.tokens.doc import Doc
+
+from .match_pattern import patterns
+
+__all__ = ("Pipeline", "pipeline")
+
+# The dependency parser is not used by any enhancer, so it is never loaded.
+EXCLUDED = ["parser"]
+
+# Components needed for part of speech tags and lemmas (used by the translations).
+TAGGING = ("tok2vec", "tagger", "attribute_ruler", "lemmatizer")
+
+# Components needed for named entities (used by the autocorrecter).
+ENTITIES = ("ner",)
+
+# Number of analysed messages kept around.
+CACHE_SIZE = 256
+
+
+class Pipeline:
+    """A spaCy pipeline shared by every enhancer.
+
+    The model is loaded once, either the first time it is used or ahead of
+    time in a background thread (see `warm_up`). The match patterns of the
+    translations are compiled along with it.
+
+    Analysed messages are cached by text and components, so the same message
+    is never analysed twice. The documents are shared, and must not be
+    modified by the enhancers.
+    """
+
+    def __init__(self, model: str = "en_core_web_sm", cache_size: int = CACHE_SIZE):
+        self.model = model
+        self._nlp: Optional[spacy.Language] = None
+        self._lock = threading.Lock()
+        self._warm_up: Optional[threading.Thread] = None
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[Tuple[str, ...], str], Doc]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # components to disable, by components needed
+        self._disabled: Dict[Tuple[str, ...], List[str]] = {}
+        self._hits: int = 0
+        self._misses: int = 0
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model has been loaded."""
+        return self._nlp is not None
+
+    @property
+    def nlp(self) -> spacy.Language:
+        """The loaded pipeline, loading it if needed."""
+        if self._nlp is None:
+            with self._lock:
+                if self._nlp is None:
+                    nlp = spacy.load(self.model, exclude=EXCLUDED)
+                    patterns.compile(nlp.vocab)
+                    self._nlp = nlp
+
+        return self._nlp
+
+    def warm_up(self) -> None:
+        """Start loading the model in a background thread."""
+        if self._warm_up or self.loaded:
+            return
+
+        self._warm_up = threading.Thread(
+            target=lambda: self.nlp,
+            name="spacy-warm-up",
+            daemon=True,
+        )
+        self._warm_up.start()
+
+    def parse(self, text: str, needs: Tuple[str, ...]) -> Doc:
+        """Analyse text, only running the components in `needs`."""
+        key = (needs, text)
+
+        with self._cache_lock:
+            doc = self._cache.get(key)
+
+            if doc is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return doc
+
+        nlp = self.nlp
+        disabled = self._disabled.get(needs)
+
+        if disabled is None:
+            disabled = [i for i in nlp.pipe_names if i not in needs]
+            self._disabled[needs] = disabled
+
+        doc = nlp(text, disable=disabled)
+
+        with self._cache_lock:
+            self._misses += 1
+            self._cache[key] = doc
+
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return doc
+
+    @property
+    def hits(self) -> int:
+        """Number of analyses answered from the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of analyses that ran the model."""
+        return self._misses
+
+
+pipeline = Pipeline()
+"""Pipeline shared by every enhancer."""
@@ -0,0 +1,147 @@
+import logging
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ("WordLists", "word_lists")
+
+log = logging.getLogger(__name__)
+
+# Directory with one list of entities per label, named like `<label>s.txt`.
+WORD_LISTS_DIR = Path(__file__).parent / "word-lists"
+
+# Entity labels that are replaced by the autocorrecter.
+ENTITY_LABELS = (
+    "EVENT",
+    "FAC",
+    "GPE",
+    "LANGUAGE",
+    "LOC",
+    "NORP",
+    "ORG",
+    "PERSON",
+    "PRODUCT",
+    "WORK_OF_ART",
+)
+
+# Seconds between checks for changed files.
+RELOAD_INTERVAL = 5
+
+
+class WordLists:
+    """Entity word lists, kept in memory.
+
+    Every list is read once, the first time one is needed or when the
+    watcher starts (see `watch`). The watcher reloads the lists when a file
+    changes, so sampling never touches the disk.
+    """
+
+    def __init__(self, directory: Path, labels: Tuple[str, ...]):
+        self.directory = directory
+        self.labels = labels
+        self._lists: Optional[Dict[str, List[str]]] = None
+        self._mtimes: Dict[Path, float] = {}
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._reloads: int = 0
+
+    def _path(self, label: str) -> Path:
+        return self.directory / f"{label.lower()}s.txt"
+
+    def _scan(self) -> Dict[Path, float]:
+        return {path: path.stat().st_mtime for path in self.directory.glob("*.txt")}
+
+    def _build(self, mtimes: Dict[Path, float]) -> Dict[str, List[str]]:
+        lists: Dict[str, List[str]] = {}
+
+        for label in self.labels:
+            path = self._path(label)
+
+            if path not in mtimes:
+                log.warning("no word list for entity label %s (expected %s)", label, path.name)
+                continue
+
+            lines = [line for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+            if not lines:
+                log.warning("word list %s is empty", path.name)
+                continue
+
+            lists[label] = lines
+
+        expected = {self._path(label) for label in self.labels}
+
+        for path in mtimes:
+            if path not in expected:
+                log.warning("word list %s does not match any entity label", path.name)
+
+        return lists
+
+    def load(self) -> Dict[str, List[str]]:
+        """Read every list from disk, returning them by label."""
+        with self._lock:
+            mtimes = self._scan()
+            lists = self._build(mtimes)
+            self._lists = lists
+            self._mtimes = mtimes
+            self._reloads += 1
+
+        return lists
+
+    def reload_if_changed(self) -> bool:
+        """Read the lists again if a file was added, removed or modified."""
+        if self._scan() == self._mtimes:
+            return False
+
+        self.load()
+        return True
+
+    def watch(self, interval: float = RELOAD_INTERVAL) -> None:
+        """Load the lists and reload them in a background thread when they change."""
+        if self._watcher:
+            return
+
+        self._watcher = threading.Thread(
+            target=self._watch,
+            args=(interval,),
+            name="word-lists-watcher",
+            daemon=True,
+        )
+        self._watcher.start()
+
+    def _watch(self, interval: float) -> None:
+        if self._lists is None:
+            self.load()
+
+        while True:
+            time.sleep(interval)
+
+            try:
+                self.reload_if_changed()
+            except OSError:
+                log.exception("failed to reload word lists")
+
+    def sample(self, label: str) -> Optional[str]:
+        """Pick a random entity with a label, or `None` if there are none."""
+        lists = self._lists
+
+        if lists is None:
+            lists = self.load()
+
+        entities = lists.get(label)
+
+        if not entities:
+            return None
+
+        return random.choice(entities)
+
+    @property
+    def reloads(self) -> int:
+        """Number of times the lists were read from disk."""
+        return self._reloads
+
+
+word_lists = WordLists(WORD_LISTS_DIR, ENTITY_LABELS)
+"""Word lists used to replace entities."""
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+__all__ = ("EnhancementPool",)
+
+log = logging.getLogger(__name__)
+
+
+class EnhancementPool:
+    """Runs message enhancement in worker threads, off the event loop.
+
+    Enhancing can take a while (the model may still be loading, or the
+    message may be long), and the event loop also drives the GUI and the
+    message listener. Each message gets `deadline` seconds, after which the
+    cheaper `fallback` is used instead. A late result is thrown away.
+
+    When `max_queued` messages are already waiting for a worker, new ones go
+    straight to the fallback rather than queueing behind them.
+    """
+
+    def __init__(
+        self,
+        enhance: Callable[[str], str],
+        fallback: Callable[[str], str],
+        deadline: float,
+        workers: int = 1,
+        max_queued: int = 8,
+    ):
+        self._enhance = enhance
+        self._fallback = fallback
+        self._deadline = deadline
+        self._max_queued = max_queued
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="enhancer")
+        self._queued: int = 0
+        self._timeouts: int = 0
+        self._shed: int = 0
+
+    async def enhance(self, message: str) -> str:
+        """Enhance a message, falling back if it takes longer than the deadline."""
+        if self._queued >= self._max_queued:
+            self._shed += 1
+            return self._fallback(message)
+
+        self._queued += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._enhance, message)
+        future.add_done_callback(self._done)
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self._deadline)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            log.warning(
+                "enhancing a message took longer than %ss (%d queued), using the fallback",
+                self._deadline,
+                self._queued,
+            )
+        except Exception:
+            log.exception("failed to enhance a message, using the fallback")
+
+        return self._fallback(message)
+
+    def _done(self, future: asyncio.Future) -> None:
+        self._queued -= 1
+
+        # retrieve the exception of abandoned futures so it is not reported as never retrieved
+        if not future.cancelled():
+            future.exception()
+
+    def close(self) -> None:
+        """Stop the workers, dropping queued messages."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def queued(self) -> int:
+        """Number of messages submitted to the workers and not finished yet."""
+        return self._queued
+
+    @property
+    def timeouts(self) -> int:
+        """Number of messages that missed the deadline."""
+        return self._timeouts
+
+    @property
+    def shed(self) -> int:
+        """Number of messages sent to the fallback because too many were queued."""
+        return self._shed
@@ -126,4 +126,5 @@ class ChatApp(tkb.Window):
 
     def close_loop(self) -> None:
         """Closes the asyncio event loop."""
+        self.connection.close()
         self.loop.stop()
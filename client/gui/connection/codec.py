@@ -0,0 +1,70 @@
+import json
+from typing import Any, Dict, Tuple, Union
+
+import msgpack
+
+# these must match server/codec.py
+FIELD_CODES: Dict[str, str] = {
+    "type": "t",
+    "message": "m",
+    "done": "d",
+    "success": "s",
+    "action": "a",
+    "content": "c",
+}
+
+MESSAGE_CODES: Tuple[str, ...] = (
+    "Connection established.",
+    "New message received.",
+    "Message was updated.",
+    "Message was deleted.",
+    "Ended handshake.",
+    "New events received.",
+    "Presence changed.",
+)
+
+Raw = Union[str, bytes]
+
+
+class JsonCodec:
+    """Plain JSON text frames, understood by every server."""
+
+    subprotocol = None
+
+    def encode(self, data: Dict[str, Any]) -> Raw:
+        """Encode a frame as JSON text."""
+        return json.dumps(data)
+
+    def decode(self, raw: Raw) -> Dict[str, Any]:
+        """Decode a JSON frame."""
+        return json.loads(raw)
+
+
+class MsgpackCodec:
+    """Compact binary MessagePack frames with short field codes."""
+
+    subprotocol = "djinn.msgpack"
+
+    def __init__(self):
+        self._field_names = {v: k for k, v in FIELD_CODES.items()}
+
+    def encode(self, data: Dict[str, Any]) -> Raw:
+        """Encode a frame as MessagePack."""
+        return msgpack.packb({FIELD_CODES.get(k, k): v for k, v in data.items()})
+
+    def decode(self, raw: Raw) -> Dict[str, Any]:
+        """Decode a MessagePack frame."""
+        res = {self._field_names.get(k, k): v for k, v in msgpack.unpackb(raw).items()}
+        message = res.get("message")
+
+        # fixed messages are sent as their index
+        if isinstance(message, int) and 0 <= message < len(MESSAGE_CODES):
+            res["message"] = MESSAGE_CODES[message]
+
+        return res
+
+
+JSON = JsonCodec()
+MSGPACK = MsgpackCodec()
+
+CODECS = {MSGPACK.subprotocol: MSGPACK}
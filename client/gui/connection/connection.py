@@ -1,16 +1,21 @@
-import json
+import asyncio
 import random
 import sys
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 import websockets
 
+from .codec import CODECS, JSON, MSGPACK
+
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 from enhancers import ciphers  # noqa: E402
 from enhancers.message_processer import (  # noqa: E402
     AutoCorrecter, AutoTranslater
 )
+from enhancers.pipeline import pipeline  # noqa: E402
+from enhancers.word_lists import word_lists  # noqa: E402
+from enhancers.worker import EnhancementPool  # noqa: E402
 
 # ADD
 DOMAIN = "ws://192.155.88.143:5005"
@@ -18,31 +23,74 @@ DOMAIN = "ws://192.155.88.143:5005"
 ROUTE = "/ws"
 URL = DOMAIN + ROUTE
 
+# seconds a message may spend being enhanced before it is sent with a quicker enhancement
+ENHANCE_DEADLINE = 0.5
+
 autocorrecter = AutoCorrecter()
 autotranslater = AutoTranslater()
 
 
+def enhance(message: str) -> str:
+    """Randomly enhance a message. May analyse it, so it should run in a worker."""
+    if random.random() < 0.05:
+        return ciphers.random_cipher(message)
+    if random.random() > 0.5:
+        return autotranslater.random_autotranslate(message)
+    return autocorrecter.random_autocorrect(message)
+
+
+def quick_enhance(message: str) -> str:
+    """Randomly enhance a message without analysing it."""
+    return autocorrecter.random_autocorrect(message, analyse=False)
+
+
+enhancement = EnhancementPool(enhance, quick_enhance, ENHANCE_DEADLINE)
+
+
 # add what ip to connect to in the constructor?
 class SocketClient:
     """API Wrapper that handles all client side communication with the server."""
 
     connected_to_room = False
 
+    def __init__(self, compact: bool = True):
+        # ask the server for MessagePack frames, servers that don't support it fall back to JSON
+        self.compact = compact
+        self.codec = JSON
+
+        # latest sequence number seen in each room, used to resume after reconnecting
+        self.room_seqs: Dict[int, int] = {}
+        self.room_id: Optional[int] = None
+        self.missed: List[Dict[str, Any]] = []
+        # IDs of the users connected to the current room
+        self.online: Set[int] = set()
+
+        # load the spaCy model while the user is logging in, instead of on the first message
+        pipeline.warm_up()
+        word_lists.watch()
+        # keeps messages in order while they are being enhanced
+        self._send_lock = asyncio.Lock()
+
     async def connect(self):
         """Connects to the server. Must be called in order for everything to work."""
-        self.ws = await websockets.connect(URL)
+        self.ws = await websockets.connect(
+            URL,
+            subprotocols=[MSGPACK.subprotocol] if self.compact else None,
+            compression="deflate",
+        )
+        self.codec = CODECS.get(self.ws.subprotocol, JSON)
 
     async def _receive(self) -> Dict[str, Any]:
         """Receives a message from the server. Converts raw data to python dict."""
         res = await self.ws.recv()
-        load = json.loads(res)
+        load = self.codec.decode(res)
         return load
 
     async def _send(
         self, type: str, payload: Dict[str, Any], reply: bool = True
     ) -> Dict[str, Any]:
         """Sends a message to the server. Expects no reply by default."""
-        req = json.dumps({"type": type, **payload})
+        req = self.codec.encode({"type": type, **payload})
         await self.ws.send(req)
         if reply:
             return await self._receive()
@@ -59,6 +107,10 @@ class SocketClient:
         res = await self._send("login", payload)
         return res["success"]
 
+    def close(self) -> None:
+        """Stops the enhancement workers. Messages still being enhanced are dropped."""
+        enhancement.close()
+
     async def logout(self) -> bool:
         """
         Logs out the user.
@@ -107,9 +159,21 @@ class SocketClient:
         Returns whether connection was successful or not.
         Authentication required. Joining room required.
         """
-        payload = {"id": id}
+        # busy rooms may send several events in a single frame, see message_listener
+        payload = {"id": id, "batch": True}
+
+        if id in self.room_seqs:
+            payload["since_seq"] = self.room_seqs[id]
+
         res = await self._send("roomconnect", payload)
         self.connected_to_room = res["success"]
+
+        if res["success"]:
+            self.room_id = id
+            self.missed = res.get("missed", [])
+            self.room_seqs[id] = res.get("seq", 0)
+            self.online = set(res.get("online", []))
+
         return res["success"]
 
     async def message_listener(self, callback: Callable[[str], None]) -> None:
@@ -119,22 +183,56 @@ class SocketClient:
         When a message is received, callback function is called on the new message.
         Authentication required. Connected room required.
         """
+        # deliver what was missed while disconnected first
+        for event in self.missed:
+            if "new" in event:
+                callback(event["new"])
+        self.missed = []
+
         async for res in self.ws:
             if not self.connected_to_room:
                 break
-            res = json.loads(res)
+            res = self.codec.decode(res)
             # if not a roomconnect message, then break
             if res["type"] != "roomconnect":
                 break
-            # edited message or new message
-            if "new" in res:
-                msg = res["new"]
-                callback(msg)  # make this the new_callback
-            elif "update" in res:
-                msg = res["update"]
-                # update_callback(msg) not implemented
+            # errors the server recovers from, like being rate limited
+            if not res.get("success", True):
+                continue
+            if "presence" in res:
+                self._track_presence(res["presence"])
+                continue
+            elif "batch" in res:
+                events = res["batch"]
+            elif "new" in res or "update" in res or "delete" in res:
+                events = [res]
             else:
-                break
+                continue
+
+            for event in events:
+                self._track_seq(event)
+                # edited message or new message
+                if "new" in event:
+                    msg = event["new"]
+                    callback(msg)  # make this the new_callback
+                elif "update" in event:
+                    msg = event["update"]
+                    # update_callback(msg) not implemented
+                elif "delete" in event:
+                    msg = event["delete"]
+                    # delete_callback(msg) not implemented
+
+    def _track_presence(self, delta: Dict[str, Any]) -> None:
+        """Apply a presence change of the connected room."""
+        self.online.update(delta.get("online", []))
+        self.online.difference_update(delta.get("offline", []))
+
+    def _track_seq(self, res: Dict[str, Any]) -> None:
+        """Remember the latest sequence number of the connected room."""
+        for key in ("new", "update", "delete"):
+            if key in res and self.room_id is not None:
+                seq = res[key].get("seq", 0)
+                self.room_seqs[self.room_id] = max(self.room_seqs.get(self.room_id, 0), seq)
 
     async def send_message(self, message: str) -> bool:
         """
@@ -143,17 +241,13 @@ class SocketClient:
         Does not expect a reply from the server.
         Authentication required. Connected room required.
         """
-        enhanced_message = message
-        if "*" not in [message[0], message[-1]]:
-            if random.random() < 0.05:
-                enhanced_message = ciphers.random_cipher(message)
-            else:
-                if random.random() > 0.5:
-                    enhanced_message = autotranslater.random_autotranslate(message)
-                else:
-                    enhanced_message = autocorrecter.random_autocorrect(message)
-        payload = {"content": enhanced_message, "action": "send"}
-        await self._send("roomconnect", payload, reply=False)
+        async with self._send_lock:
+            enhanced_message = message
+            if "*" not in [message[0], message[-1]]:
+                # enhancing runs in a worker thread, so the GUI and the listener keep running meanwhile
+                enhanced_message = await enhancement.enhance(message)
+            payload = {"content": enhanced_message, "action": "send"}
+            await self._send("roomconnect", payload, reply=False)
         return True
 
     async def exit_room(self) -> bool:
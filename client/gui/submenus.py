@@ -70,7 +70,7 @@ class FileMenu(tkb.Menu):
 
     def on_quit(self) -> None:
         """On Quit item press."""
-        self.master.loop.stop()  # end the loop
+        self.master.close_loop()  # end the loop
         sys.exit(0)
 
 
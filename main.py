@@ -1,4 +1,6 @@
+import os
 import sys
+from typing import Any, Dict
 
 import click
 import uvicorn
@@ -43,10 +45,19 @@ load_dotenv()
     type=str,
     help="IP to host the server on.",
 )
+@click.option(
+    "--workers",
+    "-w",
+    default=1,
+    show_default=True,
+    type=int,
+    help="Number of server worker processes.",
+)
 def main(
     action: str,
     port: int,
     host: str,
+    workers: int,
 ) -> None:
     """CLI entry point."""
     if not action:
@@ -60,9 +71,27 @@ def main(
             print("failed to load client!")
             sys.exit(1)
         start_app()
+        return
+
+    from server.config import PING_INTERVAL, PING_TIMEOUT
+
+    # the websockets implementation negotiates permessage-deflate and sends the pings
+    options: Dict[str, Any] = {
+        "host": host,
+        "port": port,
+        "ws": "websockets",
+        "ws_ping_interval": PING_INTERVAL,
+        "ws_ping_timeout": PING_TIMEOUT,
+    }
+
+    if workers > 1:
+        # rooms are spread across processes, so they need a shared backplane
+        os.environ.setdefault("BACKPLANE", "socket")
+        uvicorn.run("server.app:app", workers=workers, **options)
     else:
         from server.app import app
-        uvicorn.run(app, host=host, port=port)
+
+        uvicorn.run(app, **options)
 
 
 if __name__ == "__main__":
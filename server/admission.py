@@ -0,0 +1,153 @@
+import random
+import time
+from collections import Counter
+from typing import Optional
+
+from .config import (
+    ACCEPT_BURST, ACCEPT_RATE, MAX_CONNECTIONS, MAX_CONNECTIONS_PER_IP,
+    MAX_CONNECTIONS_PER_USER, SHED_RETRY_AFTER
+)
+
+__all__ = (
+    "AdmissionControl",
+    "admission",
+)
+
+
+class AdmissionControl:
+    """Class for deciding which new connections are let in.
+
+    Connections are shed when the process or a single IP is at its
+    connection cap, or when they arrive faster than the accept rate allows.
+    Shed clients are given a jittered time to wait before retrying, so a
+    reconnect storm spreads out instead of coming back all at once.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_connections: int,
+        max_per_ip: int,
+        max_per_user: int,
+        accept_rate: float,
+        accept_burst: int,
+        retry_after: float,
+    ) -> None:
+        self._max_connections = max_connections
+        self._max_per_ip = max_per_ip
+        self._max_per_user = max_per_user
+        self._accept_rate = accept_rate
+        self._accept_burst = accept_burst
+        self._retry_after = retry_after
+
+        self._tokens: float = accept_burst
+        self._updated: float = time.monotonic()
+        self._connections: int = 0
+        self._ips: "Counter[str]" = Counter()
+        self._users: "Counter[int]" = Counter()
+
+        self._shed_full: int = 0
+        self._shed_ip: int = 0
+        self._shed_rate: int = 0
+        self._shed_user: int = 0
+
+    def _jitter(self, delay: float) -> float:
+        return round(delay * random.uniform(1, 2), 1)
+
+    def admit(self, ip: str) -> Optional[float]:
+        """Try to admit a new connection.
+
+        Returns `None` if it was admitted, otherwise the number of seconds
+        the client should wait before retrying.
+        """
+        if self._connections >= self._max_connections:
+            self._shed_full += 1
+            return self._jitter(self._retry_after)
+
+        if self._ips[ip] >= self._max_per_ip:
+            self._shed_ip += 1
+            return self._jitter(self._retry_after)
+
+        now = time.monotonic()
+        self._tokens = min(
+            self._accept_burst,
+            self._tokens + (now - self._updated) * self._accept_rate,
+        )
+        self._updated = now
+
+        if self._tokens < 1:
+            self._shed_rate += 1
+            return self._jitter((1 - self._tokens) / self._accept_rate)
+
+        self._tokens -= 1
+        self._connections += 1
+        self._ips[ip] += 1
+        return None
+
+    def release(self, ip: str) -> None:
+        """Release an admitted connection."""
+        self._connections -= 1
+        self._ips[ip] -= 1
+
+        if self._ips[ip] <= 0:
+            del self._ips[ip]
+
+    def user_full(self, user_id: int) -> bool:
+        """Check whether a user is at their connection cap, counting it as shed if so."""
+        if self._users[user_id] >= self._max_per_user:
+            self._shed_user += 1
+            return True
+
+        return False
+
+    def add_user(self, user_id: int) -> None:
+        """Record that a connection logged in as a user."""
+        self._users[user_id] += 1
+
+    def release_user(self, user_id: int) -> None:
+        """Record that a connection logged out of a user."""
+        self._users[user_id] -= 1
+
+        if self._users[user_id] <= 0:
+            del self._users[user_id]
+
+    @property
+    def connections(self) -> int:
+        """Number of admitted connections."""
+        return self._connections
+
+    @property
+    def shed(self) -> int:
+        """Total number of connections and logins that were shed."""
+        return self._shed_full + self._shed_ip + self._shed_rate + self._shed_user
+
+    @property
+    def shed_full(self) -> int:
+        """Number of connections shed because the process was at its cap."""
+        return self._shed_full
+
+    @property
+    def shed_ip(self) -> int:
+        """Number of connections shed because their IP was at its cap."""
+        return self._shed_ip
+
+    @property
+    def shed_rate(self) -> int:
+        """Number of connections shed for exceeding the accept rate."""
+        return self._shed_rate
+
+    @property
+    def shed_user(self) -> int:
+        """Number of logins refused because the user was at their cap."""
+        return self._shed_user
+
+
+admission = AdmissionControl(
+    max_connections=MAX_CONNECTIONS,
+    max_per_ip=MAX_CONNECTIONS_PER_IP,
+    max_per_user=MAX_CONNECTIONS_PER_USER,
+    accept_rate=ACCEPT_RATE,
+    accept_burst=ACCEPT_BURST,
+    retry_after=SHED_RETRY_AFTER,
+)
+"""Admission control for the /ws endpoint."""
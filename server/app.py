@@ -1,7 +1,23 @@
-from fastapi import FastAPI
+import secrets
+from typing import Optional
 
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from .admission import admission
+from .backplane import backplane
+from .config import ADMIN_TOKEN
 from .db import db, make_system
+from .membership import membership
+from .metrics import metrics
+from .passwords import passwords
+from .persistence import writer
+from .presence import presence
+from .ratelimit import limits
+from .reaper import reaper
+from .registry import registry
 from .socket_router import router
+from .users import users
 
 __all__ = ("app",)
 
@@ -10,12 +26,137 @@ app = FastAPI()
 app.include_router(router)
 
 
+def _queue_depths() -> list:
+    return [i.queue_depth for i in reaper.sockets]
+
+
+# everything here is read when /metrics is scraped, nothing runs per request
+metrics.gauge("djinn_sockets", "Connected WebSockets.", lambda: reaper.live)
+metrics.gauge("djinn_rooms", "Room managers in memory.", lambda: registry.size)
+metrics.gauge(
+    "djinn_outbound_queue_depth",
+    "Frames waiting to be sent, over every connection.",
+    lambda: sum(_queue_depths()),
+)
+metrics.gauge(
+    "djinn_outbound_queue_depth_max",
+    "Frames waiting to be sent to the most backed up connection.",
+    lambda: max(_queue_depths(), default=0),
+)
+metrics.gauge("djinn_write_queue_depth", "Messages waiting to be written.", lambda: writer.queue_depth)
+metrics.gauge(
+    "djinn_write_flush_seconds",
+    "Average time taken to write a batch of messages.",
+    lambda: writer.average_flush_latency,
+)
+metrics.counter("djinn_write_flushes_total", "Batches of messages written.", lambda: writer.flushes)
+metrics.counter("djinn_written_messages_total", "Messages written.", lambda: writer.flushed)
+metrics.counter("djinn_write_retries_total", "Batches of messages retried after failing.", lambda: writer.retries)
+metrics.counter("djinn_write_failures_total", "Messages given up after failing to be written.", lambda: writer.failed)
+metrics.gauge("djinn_password_pending", "Password operations running or waiting.", lambda: passwords.pending)
+metrics.gauge(
+    "djinn_password_wait_seconds",
+    "Average time password operations waited for a thread.",
+    lambda: passwords.average_wait,
+)
+metrics.counter(
+    "djinn_password_rejected_total",
+    "Password operations rejected because the pool was busy.",
+    lambda: passwords.rejected,
+)
+metrics.gauge("djinn_user_cache_size", "Users in the user cache.", lambda: users.size)
+metrics.counter("djinn_user_cache_hits_total", "User cache hits.", lambda: users.hits)
+metrics.counter("djinn_user_cache_misses_total", "User cache misses.", lambda: users.misses)
+metrics.gauge("djinn_membership_rooms", "Rooms in the membership index.", lambda: membership.size)
+metrics.counter("djinn_membership_checks_total", "Membership index checks.", lambda: membership.checks)
+metrics.counter(
+    "djinn_membership_inconsistent_rooms_total",
+    "Rooms found inconsistent with the database by membership checks.",
+    lambda: membership.inconsistent,
+)
+metrics.counter("djinn_room_evictions_total", "Room managers evicted.", lambda: registry.evictions)
+metrics.counter("djinn_backplane_published_total", "Events published.", lambda: backplane.published)
+metrics.counter("djinn_backplane_received_total", "Events received.", lambda: backplane.received)
+metrics.counter(
+    "djinn_backplane_dropped_total",
+    "Events a peer worker could not accept.",
+    lambda: backplane.dropped,
+)
+metrics.counter(
+    "djinn_unwritten_expired_total",
+    "Messages whose write was never confirmed to their room, usually after a dropped event.",
+    lambda: registry.expired_unwritten,
+)
+metrics.counter(
+    "djinn_presence_published_total",
+    "Presence changes published.",
+    lambda: presence.published,
+)
+metrics.counter(
+    "djinn_presence_expired_total",
+    "Workers dropped from presence for not announcing their state.",
+    lambda: presence.expired,
+)
+metrics.counter("djinn_rate_limited_total", "Requests rejected by rate limits.", lambda: limits.rejected)
+metrics.counter("djinn_reaped_dead_total", "Dead connections reaped.", lambda: reaper.reaped_dead)
+metrics.counter("djinn_reaped_idle_total", "Idle connections closed.", lambda: reaper.reaped_idle)
+metrics.gauge("djinn_admitted_connections", "Admitted connections.", lambda: admission.connections)
+metrics.counter("djinn_shed_total", "Connections and logins shed.", lambda: admission.shed)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_route() -> str:
+    """Metrics in the Prometheus text format."""
+    return metrics.render()
+
+
+def _ensure_admin(authorization: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+
+    if not authorization or not secrets.compare_digest(authorization, f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(status_code=403)
+
+
+@app.post("/admin/membership/check")
+async def membership_check_route(
+    repair: bool = False,
+    authorization: Optional[str] = Header(None),
+) -> dict:
+    """Compare the membership index of this worker against the database."""
+    _ensure_admin(authorization)
+    checked = membership.size
+    res = await membership.check(repair=repair)
+
+    return {
+        "checked": checked,
+        "repaired": repair,
+        "inconsistent": {
+            rid: {"missing": sorted(missing), "extra": sorted(extra)}
+            for rid, (missing, extra) in res.items()
+        },
+    }
+
+
 @app.on_event("startup")
 async def startup():
     await db.connect()
-    await make_system()
+    users.pin(await make_system())
+    writer.start()
+    await backplane.start()
+    reaper.start()
+    registry.start()
+    presence.start()
+    metrics.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await metrics.close()
+    await presence.close()
+    await reaper.close()
+    await registry.close()
+    await writer.close()
+    await backplane.close()
     await db.disconnect()
+    passwords.close()
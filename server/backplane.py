@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import socket
+import stat
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+
+import orjson
+
+from .config import BACKPLANE, BACKPLANE_PATH
+
+__all__ = (
+    "Backplane",
+    "LocalBackplane",
+    "SocketBackplane",
+    "backplane",
+)
+
+log = logging.getLogger(__name__)
+
+EventHandler = Callable[[int, str, dict], None]
+PeerHandler = Callable[[int], None]
+
+
+class Backplane(ABC):
+    """Base class for delivering room events to every worker process.
+
+    Events are published with a room ID, a kind, and JSON serializable data,
+    and are passed to the handler of every worker (including the one that
+    published it).
+    """
+
+    shared: bool = False
+    """Whether events are shared with other processes."""
+
+    def __init__(self) -> None:
+        self._handler: Optional[EventHandler] = None
+        self._peer_handler: Optional[PeerHandler] = None
+        self._published: int = 0
+        self._received: int = 0
+        self._dropped: int = 0
+
+    def set_handler(self, handler: EventHandler) -> None:
+        """Set the function that receives events."""
+        self._handler = handler
+
+    def set_peer_handler(self, handler: PeerHandler) -> None:
+        """Set the function called with the PID of a worker that went away."""
+        self._peer_handler = handler
+
+    def _peer_lost(self, pid: int) -> None:
+        if self._peer_handler:
+            self._peer_handler(pid)
+
+    def _deliver(self, room_id: int, kind: str, data: dict) -> None:
+        self._received += 1
+
+        if self._handler:
+            self._handler(room_id, kind, data)
+
+    async def start(self) -> None:
+        """Start receiving events."""
+
+    async def close(self) -> None:
+        """Stop receiving events."""
+
+    @abstractmethod
+    def publish(self, room_id: int, kind: str, data: dict) -> None:
+        """Publish an event to every worker."""
+
+    @property
+    def published(self) -> int:
+        """Number of events published by this worker."""
+        return self._published
+
+    @property
+    def received(self) -> int:
+        """Number of events delivered to this worker."""
+        return self._received
+
+    @property
+    def dropped(self) -> int:
+        """Number of events that a peer could not accept."""
+        return self._dropped
+
+
+class LocalBackplane(Backplane):
+    """Backplane that only delivers events inside the current process."""
+
+    def publish(self, room_id: int, kind: str, data: dict) -> None:
+        """Publish an event to this process."""
+        self._published += 1
+        self._deliver(room_id, kind, data)
+
+
+class SocketBackplane(Backplane):
+    """Backplane that shares events between workers on the same machine.
+
+    Every worker binds a Unix datagram socket in a shared directory, and
+    events are sent to every other socket found there.
+    """
+
+    shared = True
+    PEER_REFRESH: float = 1.0
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self._path = path
+        self._address = os.path.join(path, f"{os.getpid()}.sock")
+        self._socket: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_refreshed: float = 0.0
+
+    def _ensure_private(self) -> None:
+        # anyone who can write here could read every event and inject forged ones
+        os.makedirs(self._path, mode=0o700, exist_ok=True)
+        info = os.lstat(self._path)
+
+        if not stat.S_ISDIR(info.st_mode):
+            raise RuntimeError(f"backplane path {self._path} is not a directory")
+
+        if info.st_uid != os.getuid():
+            raise RuntimeError(f"backplane path {self._path} is not owned by the current user")
+
+        if info.st_mode & 0o077:
+            raise RuntimeError(f"backplane path {self._path} is accessible to other users")
+
+    async def start(self) -> None:
+        """Bind the socket of this worker and start receiving events."""
+        self._ensure_private()
+
+        if os.path.exists(self._address):
+            os.unlink(self._address)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self._address)
+        sock.setblocking(False)
+        self._socket = sock
+
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    async def close(self) -> None:
+        """Unbind the socket of this worker."""
+        if not self._socket:
+            return
+
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+
+        if os.path.exists(self._address):
+            os.unlink(self._address)
+
+    def _on_readable(self) -> None:
+        assert self._socket
+
+        while True:
+            try:
+                packet = self._socket.recv(65536)
+            except BlockingIOError:
+                return
+
+            room_id, kind, data = orjson.loads(packet)
+            self._deliver(room_id, kind, data)
+
+    def _refresh_peers(self) -> None:
+        now = time.monotonic()
+
+        if now - self._peers_refreshed < self.PEER_REFRESH:
+            return
+
+        self._peers_refreshed = now
+        peers = [
+            os.path.join(self._path, i)
+            for i in os.listdir(self._path)
+            if i.endswith(".sock") and os.path.join(self._path, i) != self._address
+        ]
+
+        # workers that shut down remove their socket
+        for peer in set(self._peers) - set(peers):
+            self._peer_lost(self._pid_of(peer))
+
+        self._peers = peers
+
+    @staticmethod
+    def _pid_of(peer: str) -> int:
+        return int(os.path.basename(peer).removesuffix(".sock"))
+
+    def publish(self, room_id: int, kind: str, data: dict) -> None:
+        """Publish an event to every worker."""
+        self._published += 1
+        self._deliver(room_id, kind, data)
+
+        if not self._socket:
+            return
+
+        self._refresh_peers()
+        packet = orjson.dumps([room_id, kind, data])
+
+        for peer in list(self._peers):
+            try:
+                self._socket.sendto(packet, peer)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # the worker is gone, so clean up after it
+                self._peers.remove(peer)
+
+                if os.path.exists(peer):
+                    os.unlink(peer)
+
+                self._peer_lost(self._pid_of(peer))
+            except BlockingIOError:
+                self._dropped += 1
+                log.warning("backplane peer %s is not keeping up", peer)
+
+
+def _make_backplane() -> Backplane:
+    if BACKPLANE == "socket":
+        return SocketBackplane(BACKPLANE_PATH)
+
+    return LocalBackplane()
+
+
+backplane = _make_backplane()
+"""Backplane used by every room."""
@@ -0,0 +1,133 @@
+from typing import Dict, Optional, Tuple, Union
+
+import msgpack
+import orjson
+
+__all__ = (
+    "Codec",
+    "JsonCodec",
+    "MsgpackCodec",
+    "CODECS",
+    "negotiate",
+)
+
+Raw = Union[str, bytes]
+
+# short codes for keys that are on every frame
+# these must match client/gui/connection/codec.py
+FIELD_CODES: Dict[str, str] = {
+    "type": "t",
+    "message": "m",
+    "done": "d",
+    "success": "s",
+    "action": "a",
+    "content": "c",
+}
+
+# fixed messages that are sent as their index instead of the full string
+MESSAGE_CODES: Tuple[str, ...] = (
+    "Connection established.",
+    "New message received.",
+    "Message was updated.",
+    "Message was deleted.",
+    "Ended handshake.",
+    "New events received.",
+    "Presence changed.",
+)
+
+
+class Codec:
+    """Base class for encoding and decoding frames."""
+
+    name: str = ""
+    subprotocol: Optional[str] = None
+    """WebSocket subprotocol that selects this codec."""
+    invalid_message: str = ""
+    """Error sent back when a frame can't be decoded."""
+
+    def encode(self, data: dict) -> Raw:
+        """Encode a frame."""
+        raise NotImplementedError
+
+    def decode(self, raw: Raw) -> dict:
+        """Decode a frame, raising `ValueError` if it is invalid."""
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Plain JSON text frames. This is the default."""
+
+    name = "json"
+    invalid_message = "Invalid JSON object."
+
+    def encode(self, data: dict) -> Raw:
+        """Encode a frame as JSON text."""
+        return orjson.dumps(data).decode()
+
+    def decode(self, raw: Raw) -> dict:
+        """Decode a JSON frame."""
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(str(e)) from e
+
+        if not isinstance(data, dict):
+            raise ValueError("frame is not an object")
+
+        return data
+
+
+class MsgpackCodec(Codec):
+    """Binary MessagePack frames with short field codes."""
+
+    name = "msgpack"
+    subprotocol = "djinn.msgpack"
+    invalid_message = "Invalid MessagePack object."
+
+    _fields = FIELD_CODES
+    _field_names = {v: k for k, v in FIELD_CODES.items()}
+    _messages = {v: i for i, v in enumerate(MESSAGE_CODES)}
+
+    def encode(self, data: dict) -> Raw:
+        """Encode a frame as MessagePack."""
+        res = {self._fields.get(k, k): v for k, v in data.items()}
+        message = res.get("m")
+
+        if isinstance(message, str):
+            res["m"] = self._messages.get(message, message)
+
+        return msgpack.packb(res)
+
+    def decode(self, raw: Raw) -> dict:
+        """Decode a MessagePack frame."""
+        if isinstance(raw, str):
+            raise ValueError("expected a binary frame")
+
+        try:
+            data = msgpack.unpackb(raw)
+        except (ValueError, TypeError) as e:
+            raise ValueError(str(e)) from e
+
+        if not isinstance(data, dict):
+            raise ValueError("frame is not a map")
+
+        return {self._field_names.get(k, k): v for k, v in data.items()}
+
+
+JSON = JsonCodec()
+
+CODECS: Dict[str, Codec] = {
+    codec.subprotocol: codec for codec in (MsgpackCodec(),) if codec.subprotocol
+}
+"""Opt-in codecs by WebSocket subprotocol."""
+
+
+def negotiate(subprotocols: list) -> Codec:
+    """Pick the codec for the subprotocols offered by a client, in order of preference."""
+    for i in subprotocols:
+        codec = CODECS.get(i)
+
+        if codec:
+            return codec
+
+    return JSON
@@ -0,0 +1,229 @@
+import os
+import tempfile
+from typing import Dict
+
+__all__ = (
+    "OUTBOUND_QUEUE_SIZE",
+    "SLOW_CONSUMER_POLICY",
+    "MESSAGE_QUEUE_SIZE",
+    "MESSAGE_BATCH_SIZE",
+    "MESSAGE_FLUSH_INTERVAL",
+    "MESSAGE_WRITE_RETRIES",
+    "MESSAGE_RETRY_DELAY",
+    "USER_CACHE_TTL",
+    "USER_CACHE_SIZE",
+    "RECENT_MESSAGES",
+    "BACKPLANE",
+    "BACKPLANE_PATH",
+    "PASSWORD_WORKERS",
+    "PASSWORD_MAX_PENDING",
+    "ARGON2_TIME_COST",
+    "ARGON2_MEMORY_COST",
+    "ARGON2_PARALLELISM",
+    "EVENT_LOG_SIZE",
+    "RATE_LIMIT_PERIOD",
+    "RATE_LIMITS",
+    "PING_INTERVAL",
+    "PING_TIMEOUT",
+    "AUTH_TIMEOUT",
+    "REAP_INTERVAL",
+    "ROOM_IDLE_TTL",
+    "ROOM_CACHE_SIZE",
+    "UNWRITTEN_TIMEOUT",
+    "MAX_CONNECTIONS",
+    "MAX_CONNECTIONS_PER_IP",
+    "MAX_CONNECTIONS_PER_USER",
+    "ACCEPT_RATE",
+    "ACCEPT_BURST",
+    "SHED_RETRY_AFTER",
+    "COALESCE_WINDOW",
+    "COALESCE_RATE",
+    "COALESCE_BUSY_WINDOW",
+    "PRESENCE_DEBOUNCE",
+    "PRESENCE_ANNOUNCE_INTERVAL",
+    "ADMIN_TOKEN",
+)
+
+# configuration values are read from the environment (see .env)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_str(name: str, default: str) -> str:
+    return os.environ.get(name) or default
+
+
+def _env_limits(name: str) -> Dict[str, int]:
+    # formatted as "type=limit,type=limit"
+    res: Dict[str, int] = {}
+
+    for item in (os.environ.get(name) or "").split(","):
+        if not item.strip():
+            continue
+
+        key, _, value = item.partition("=")
+        res[key.strip()] = int(value)
+
+    return res
+
+
+OUTBOUND_QUEUE_SIZE: int = _env_int("OUTBOUND_QUEUE_SIZE", 256)
+"""Maximum number of pending outbound frames for a single connection."""
+
+SLOW_CONSUMER_POLICY: str = _env_str("SLOW_CONSUMER_POLICY", "drop").lower()
+"""What to do when a connection's outbound queue is full.
+
+`drop` discards the new frame for that connection, `disconnect` closes it.
+"""
+
+if SLOW_CONSUMER_POLICY not in {"drop", "disconnect"}:
+    raise ValueError(
+        f'SLOW_CONSUMER_POLICY must be "drop" or "disconnect", got "{SLOW_CONSUMER_POLICY}"',
+    )
+
+MESSAGE_QUEUE_SIZE: int = _env_int("MESSAGE_QUEUE_SIZE", 10000)
+"""Maximum number of messages waiting to be written to the database."""
+
+MESSAGE_BATCH_SIZE: int = _env_int("MESSAGE_BATCH_SIZE", 100)
+"""Number of pending messages that triggers an immediate flush."""
+
+MESSAGE_FLUSH_INTERVAL: float = _env_float("MESSAGE_FLUSH_INTERVAL", 0.05)
+"""Maximum time (in seconds) a message waits before being flushed."""
+
+MESSAGE_WRITE_RETRIES: int = _env_int("MESSAGE_WRITE_RETRIES", 5)
+"""Number of times a batch that failed to be written is retried before it is given up."""
+
+MESSAGE_RETRY_DELAY: float = _env_float("MESSAGE_RETRY_DELAY", 0.5)
+"""Time (in seconds) before the first retry of a failed batch, doubled on every retry."""
+
+USER_CACHE_TTL: float = _env_float("USER_CACHE_TTL", 300)
+"""Time (in seconds) a user stays in the user cache."""
+
+USER_CACHE_SIZE: int = _env_int("USER_CACHE_SIZE", 10000)
+"""Maximum number of users held in the user cache."""
+
+RECENT_MESSAGES: int = _env_int("RECENT_MESSAGES", 100)
+"""Number of recent messages each room keeps in memory."""
+
+BACKPLANE: str = _env_str("BACKPLANE", "local").lower()
+"""How room events reach other worker processes.
+
+`local` keeps them in the current process, `socket` shares them with every
+worker on the machine through Unix datagram sockets.
+"""
+
+if BACKPLANE not in {"local", "socket"}:
+    raise ValueError(f'BACKPLANE must be "local" or "socket", got "{BACKPLANE}"')
+
+BACKPLANE_PATH: str = _env_str(
+    "BACKPLANE_PATH",
+    os.path.join(
+        os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+        f"genuine-djinn-backplane-{os.getuid()}",
+    ),
+)
+"""Directory holding the sockets of the `socket` backplane.
+
+It must be owned by the user running the server and not accessible to anyone else.
+"""
+
+PASSWORD_WORKERS: int = _env_int("PASSWORD_WORKERS", min(4, os.cpu_count() or 1))
+"""Number of threads used for hashing and verifying passwords."""
+
+PASSWORD_MAX_PENDING: int = _env_int("PASSWORD_MAX_PENDING", 256)
+"""Maximum number of password operations running or waiting at once."""
+
+# defaults match argon2-cffi
+ARGON2_TIME_COST: int = _env_int("ARGON2_TIME_COST", 3)
+ARGON2_MEMORY_COST: int = _env_int("ARGON2_MEMORY_COST", 65536)
+ARGON2_PARALLELISM: int = _env_int("ARGON2_PARALLELISM", 4)
+
+EVENT_LOG_SIZE: int = _env_int("EVENT_LOG_SIZE", 1000)
+"""Number of recent events each room keeps in memory for reconnecting clients."""
+
+RATE_LIMIT_PERIOD: float = _env_float("RATE_LIMIT_PERIOD", 10)
+"""Time (in seconds) over which a connection's rate limits refill."""
+
+RATE_LIMITS: Dict[str, int] = _env_limits("RATE_LIMITS")
+"""Requests allowed per period for each operation or room action.
+
+These replace the defaults set on the operations, and `-1` removes a limit.
+"""
+
+PING_INTERVAL: float = _env_float("PING_INTERVAL", 20)
+"""Time (in seconds) between WebSocket pings sent to each client."""
+
+PING_TIMEOUT: float = _env_float("PING_TIMEOUT", 20)
+"""Time (in seconds) a client has to answer a ping before it is disconnected."""
+
+AUTH_TIMEOUT: float = _env_float("AUTH_TIMEOUT", 30)
+"""Time (in seconds) an unauthenticated connection may stay idle before it is closed."""
+
+REAP_INTERVAL: float = _env_float("REAP_INTERVAL", 5)
+"""Time (in seconds) between checks for dead and idle connections."""
+
+ROOM_IDLE_TTL: float = _env_float("ROOM_IDLE_TTL", 300)
+"""Time (in seconds) a room with nobody connected stays loaded in memory."""
+
+ROOM_CACHE_SIZE: int = _env_int("ROOM_CACHE_SIZE", 1000)
+"""Maximum number of rooms loaded in memory, when enough of them are idle."""
+
+UNWRITTEN_TIMEOUT: float = _env_float("UNWRITTEN_TIMEOUT", 120)
+"""Time (in seconds) a room waits to hear that a message was written before it stops waiting.
+
+This only happens when the event was lost, and keeps the room from never becoming idle.
+"""
+
+MAX_CONNECTIONS: int = _env_int("MAX_CONNECTIONS", 10000)
+"""Maximum number of open connections to this process."""
+
+MAX_CONNECTIONS_PER_IP: int = _env_int("MAX_CONNECTIONS_PER_IP", 100)
+"""Maximum number of open connections from a single IP address."""
+
+MAX_CONNECTIONS_PER_USER: int = _env_int("MAX_CONNECTIONS_PER_USER", 10)
+"""Maximum number of connections logged in as the same user."""
+
+ACCEPT_RATE: float = _env_float("ACCEPT_RATE", 100)
+"""Number of new connections accepted per second, on average."""
+
+ACCEPT_BURST: int = _env_int("ACCEPT_BURST", 200)
+"""Number of new connections that may be accepted at once, above the accept rate."""
+
+SHED_RETRY_AFTER: float = _env_float("SHED_RETRY_AFTER", 5)
+"""Base time (in seconds) a client turned away at a connection cap is told to wait."""
+
+COALESCE_WINDOW: float = _env_float("COALESCE_WINDOW", 0)
+"""Time (in seconds) every room collects events to send them in a single batch frame.
+
+`0` leaves coalescing to busy rooms (see `COALESCE_RATE`). Only clients that
+asked for batches get them.
+"""
+
+COALESCE_RATE: float = _env_float("COALESCE_RATE", 50)
+"""Number of events per second above which a room coalesces them, `0` for never."""
+
+COALESCE_BUSY_WINDOW: float = _env_float("COALESCE_BUSY_WINDOW", 0.005)
+"""Time (in seconds) a room above `COALESCE_RATE` collects events into a single batch frame."""
+
+PRESENCE_DEBOUNCE: float = _env_float("PRESENCE_DEBOUNCE", 2)
+"""Time (in seconds) connects and disconnects are collected before presence changes are sent.
+
+Clients that reconnect within this time never appear to go offline.
+"""
+
+PRESENCE_ANNOUNCE_INTERVAL: float = _env_float("PRESENCE_ANNOUNCE_INTERVAL", 30)
+"""Time (in seconds) between announcements of the full presence state of a worker.
+
+A worker that misses three announcements is considered gone.
+"""
+
+ADMIN_TOKEN: str = _env_str("ADMIN_TOKEN", "")
+"""Bearer token required by the `/admin` routes. They are disabled when empty."""
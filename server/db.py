@@ -1,4 +1,5 @@
 from prisma import Prisma
+from prisma.models import User
 
 # db should be in this file to stop circular dependency issues
 
@@ -7,14 +8,14 @@ db = Prisma()
 SYSTEM_NAME: str = "_SYSTEM"
 
 
-async def make_system():
+async def make_system() -> User:
     """Initalizes the system user."""
     system = await db.user.find_unique({"id": 0})
 
     if system:
-        return
+        return system
 
-    await db.user.create(
+    return await db.user.create(
         {
             "id": 0,
             "name": SYSTEM_NAME,
@@ -0,0 +1,66 @@
+from typing import Dict, Optional, Tuple
+
+import orjson
+
+from .codec import JSON, Codec, Raw
+
+__all__ = ("Frame",)
+
+
+class Frame:
+    """Broadcast frame that is serialized once and shared between recipients.
+
+    The only per-recipient fields are `type`, which mimics the type header of
+    each recipient's handshake, and the codec the recipient negotiated. Each
+    distinct combination is encoded at most once.
+    """
+
+    __slots__ = ("_data", "_body", "_rendered")
+
+    def __init__(self, data: dict) -> None:
+        self._data = data
+        self._body: Optional[str] = None
+        self._rendered: Dict[Tuple[str, str], Raw] = {}
+
+    @classmethod
+    def encode(
+        cls,
+        *,
+        success: bool = True,
+        done: bool = False,
+        payload: Optional[dict] = None,
+        message: Optional[str] = None,
+    ) -> "Frame":
+        """Make a response that will be sent to many clients."""
+        return cls(
+            {
+                "done": done,
+                "message": message,
+                "success": success,
+                **(payload or {}),
+            }
+        )
+
+    @property
+    def body(self) -> str:
+        """JSON encoded frame without the type header."""
+        if self._body is None:
+            self._body = orjson.dumps(self._data).decode()
+
+        return self._body
+
+    def render(self, type: str, codec: Codec = JSON) -> Raw:
+        """Get the encoded frame for a specific type header and codec."""
+        key = (codec.name, type)
+        res = self._rendered.get(key)
+
+        if res is None:
+            if codec is JSON:
+                # the body always starts with "{" followed by at least one key
+                res = '{"type":' + orjson.dumps(type).decode() + "," + self.body[1:]
+            else:
+                res = codec.encode({"type": type, **self._data})
+
+            self._rendered[key] = res
+
+        return res
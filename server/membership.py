@@ -0,0 +1,142 @@
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, Set, Tuple
+
+from .db import db
+
+__all__ = (
+    "MembershipIndex",
+    "membership",
+)
+
+
+class MembershipIndex:
+    """In-memory index of which users have joined which rooms.
+
+    Rooms are loaded from the database the first time they are looked up,
+    and are then kept current by the join, leave and create operations.
+    """
+
+    def __init__(self) -> None:
+        self._rooms: Dict[int, Set[int]] = {}
+        self._users: DefaultDict[int, Set[int]] = defaultdict(set)
+        self._checks: int = 0
+        self._inconsistent: int = 0
+
+    def load(self, room_id: int, user_ids: Iterable[int]) -> None:
+        """Load the members of a room, unless it is already loaded."""
+        if room_id in self._rooms:
+            return
+
+        members = set(user_ids)
+        self._rooms[room_id] = members
+
+        for uid in members:
+            self._users[uid].add(room_id)
+
+    async def ensure(self, room_id: int) -> bool:
+        """Make sure a room is loaded. Returns whether the room exists."""
+        if room_id in self._rooms:
+            return True
+
+        room = await db.room.find_unique(
+            {"id": room_id},
+            include={"users": True},
+        )
+
+        if not room:
+            return False
+
+        self.load(room_id, [i.id for i in (room.users or [])])
+        return True
+
+    async def is_member(self, room_id: int, user_id: int) -> bool:
+        """Check whether a user has joined a room."""
+        if not await self.ensure(room_id):
+            return False
+
+        return user_id in self._rooms[room_id]
+
+    def add(self, room_id: int, user_id: int) -> None:
+        """Record that a user joined a room."""
+        members = self._rooms.get(room_id)
+
+        # rooms that aren't loaded will get the change from the database later
+        if members is not None:
+            members.add(user_id)
+            self._users[user_id].add(room_id)
+
+    def remove(self, room_id: int, user_id: int) -> None:
+        """Record that a user left a room."""
+        members = self._rooms.get(room_id)
+
+        if members is not None:
+            members.discard(user_id)
+            self._users[user_id].discard(room_id)
+
+    def forget(self, room_id: int) -> None:
+        """Drop a room from the index. It will be reloaded on next use."""
+        members = self._rooms.pop(room_id, None)
+
+        for uid in members or ():
+            rooms = self._users[uid]
+            rooms.discard(room_id)
+
+            if not rooms:
+                del self._users[uid]
+
+    def members(self, room_id: int) -> Set[int]:
+        """Members of a loaded room."""
+        return self._rooms.get(room_id, set())
+
+    def rooms_of(self, user_id: int) -> Set[int]:
+        """Loaded rooms that a user has joined."""
+        return self._users.get(user_id, set())
+
+    async def check(
+        self,
+        *,
+        repair: bool = False,
+    ) -> Dict[int, Tuple[Set[int], Set[int]]]:
+        """Compare the index against the database.
+
+        Returns a dictionary of inconsistent room IDs to a tuple of
+        (members missing from the index, members that shouldn't be in it).
+        """
+        res: Dict[int, Tuple[Set[int], Set[int]]] = {}
+
+        for rid, members in list(self._rooms.items()):
+            room = await db.room.find_unique(
+                {"id": rid},
+                include={"users": True},
+            )
+            actual = {i.id for i in ((room.users or []) if room else [])}
+
+            if actual != members:
+                res[rid] = (actual - members, members - actual)
+
+        if repair:
+            for rid in res:
+                self.forget(rid)
+
+        self._checks += 1
+        self._inconsistent += len(res)
+        return res
+
+    @property
+    def checks(self) -> int:
+        """Number of times the index was compared against the database."""
+        return self._checks
+
+    @property
+    def inconsistent(self) -> int:
+        """Number of inconsistent rooms found by every check."""
+        return self._inconsistent
+
+    @property
+    def size(self) -> int:
+        """Number of loaded rooms."""
+        return len(self._rooms)
+
+
+membership = MembershipIndex()
+"""Membership index shared by every connection."""
@@ -0,0 +1,210 @@
+import asyncio
+import time
+from bisect import bisect_left
+from contextlib import suppress
+from typing import Callable, Dict, List, Optional, Tuple
+
+__all__ = (
+    "Histogram",
+    "HistogramFamily",
+    "Metrics",
+    "metrics",
+    "operation_latency",
+    "action_latency",
+    "fanout_latency",
+)
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+FANOUT_BUCKETS: Tuple[float, ...] = (
+    0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1,
+)
+
+
+class Histogram:
+    """Histogram with fixed buckets.
+
+    Every bucket is allocated up front, so observing a value only bumps a
+    counter and the running sum.
+    """
+
+    __slots__ = ("_bounds", "_counts", "_sum")
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self._bounds = bounds
+        # the last count is for values above every bound
+        self._counts: List[int] = [0] * (len(bounds) + 1)
+        self._sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        """Record a value."""
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+
+    @property
+    def count(self) -> int:
+        """Number of recorded values."""
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        """Sum of the recorded values."""
+        return self._sum
+
+    def render(self, name: str, labels: str, out: List[str]) -> None:
+        """Write the histogram in the Prometheus text format."""
+        sep = "," if labels else ""
+        total = 0
+
+        for bound, count in zip(self._bounds, self._counts):
+            total += count
+            out.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+
+        total += self._counts[-1]
+        out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {total}')
+
+        suffix = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{suffix} {self._sum}")
+        out.append(f"{name}_count{suffix} {total}")
+
+
+class HistogramFamily:
+    """Histograms sharing a name, one for each value of a label."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label: Optional[str] = None,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self._label = label
+        self._buckets = buckets
+        self._children: Dict[str, Histogram] = {}
+
+    def labels(self, value: str = "") -> Histogram:
+        """Get the histogram for a label value, creating it if needed.
+
+        This should be called once when setting up, not on every observation.
+        """
+        child = self._children.get(value)
+
+        if not child:
+            child = Histogram(self._buckets)
+            self._children[value] = child
+
+        return child
+
+    def render(self, out: List[str]) -> None:
+        """Write every histogram in the Prometheus text format."""
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} histogram")
+
+        for value, child in self._children.items():
+            labels = f'{self._label}="{value}"' if self._label else ""
+            child.render(self.name, labels, out)
+
+
+class Metrics:
+    """Registry of metrics exposed on `/metrics`.
+
+    Histograms are updated as things happen. Everything else is read from
+    the subsystems that already keep count, when the metrics are scraped.
+    """
+
+    def __init__(self, lag_interval: float = 0.5) -> None:
+        self._histograms: List[HistogramFamily] = []
+        self._values: List[Tuple[str, str, str, Callable[[], float]]] = []
+        self._lag_interval = lag_interval
+        self._lag: float = 0.0
+        self._loop_lag = self.histogram(
+            "djinn_event_loop_lag_seconds",
+            "How late the event loop woke up a sleeping task.",
+        ).labels()
+        self.gauge(
+            "djinn_event_loop_lag_last_seconds",
+            "Most recent event loop lag measurement.",
+            lambda: self._lag,
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        label: Optional[str] = None,
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> HistogramFamily:
+        """Register a histogram."""
+        family = HistogramFamily(name, help, label, buckets)
+        self._histograms.append(family)
+        return family
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> None:
+        """Register a gauge, read from `fn` on every scrape."""
+        self._values.append((name, help, "gauge", fn))
+
+    def counter(self, name: str, help: str, fn: Callable[[], float]) -> None:
+        """Register a counter, read from `fn` on every scrape."""
+        self._values.append((name, help, "counter", fn))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        out: List[str] = []
+
+        for name, help, kind, fn in self._values:
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            out.append(f"{name} {fn()}")
+
+        for family in self._histograms:
+            family.render(out)
+
+        out.append("")
+        return "\n".join(out)
+
+    def start(self) -> None:
+        """Start measuring the event loop lag."""
+        self._task = asyncio.create_task(self._measure_lag())
+
+    async def close(self) -> None:
+        """Stop measuring the event loop lag."""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _measure_lag(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self._lag_interval)
+            self._lag = max(time.monotonic() - start - self._lag_interval, 0.0)
+            self._loop_lag.observe(self._lag)
+
+
+metrics = Metrics()
+"""Metrics of this process."""
+
+operation_latency = metrics.histogram(
+    "djinn_operation_seconds",
+    "Time taken to handle a handshake, or to establish a room connection, by type header.",
+    "operation",
+)
+"""Latency of top level operations, see `operations`."""
+
+action_latency = metrics.histogram(
+    "djinn_room_action_seconds",
+    "Time taken to handle a room action.",
+    "action",
+)
+"""Latency of room actions, see `RECEIVER_OPERATIONS`."""
+
+fanout_latency = metrics.histogram(
+    "djinn_broadcast_fanout_seconds",
+    "Time taken to queue a broadcast frame for every connection in a room.",
+    buckets=FANOUT_BUCKETS,
+).labels()
+"""Time taken by room broadcasts."""
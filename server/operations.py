@@ -1,20 +1,24 @@
-from dataclasses import dataclass
-from typing import Awaitable, Callable, Dict
-
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
 
+from .admission import admission
+from .backplane import backplane
 from .db import db
-from .rooms import RoomManager
-from .utils import create_string, find_room_for, references, room_dict
+from .membership import membership
+from .metrics import Histogram, operation_latency
+from .passwords import PasswordPoolBusy, passwords
+from .presence import presence
+from .ratelimit import limits
+from .registry import registry
+from .structs import Empty, request
+from .users import users
+from .utils import create_string, references, room_dict, user_dict
 from .ws import SocketHandshake
 
-hasher = PasswordHasher()
-
 __all__ = ("operations",)
 
-OperationFunc = Callable[[SocketHandshake], Awaitable[None]]
-ROOMS: Dict[int, RoomManager] = {}
+OperationFunc = Callable[[SocketHandshake, Any], Awaitable[None]]
 
 
 @dataclass
@@ -22,62 +26,114 @@ class Operation:
     """Dataclass for holding session operation information."""
 
     fn: OperationFunc
+    request: Type[Any] = Empty
+    ensure_logged: bool = False
     limit: int = -1
+    # the handshake stays open after the first reply, which ends its latency
+    session: bool = False
+    slot: int = field(default=-1, init=False)
+    latency: Histogram = field(init=False)
 
 
-async def _get_manager(rid: int) -> RoomManager:
-    manager = ROOMS.get(rid)
+def _on_event(rid: int, kind: str, data: dict) -> None:
+    manager = registry.get(rid)
 
-    if not manager:
-        manager = RoomManager(rid)
-        ROOMS[rid] = manager
+    # workers without a manager have nobody to deliver room changes to
+    if kind == "joined":
+        membership.add(rid, data["user"]["id"])
 
-    return manager
+        if manager:
+            manager.broadcast_presence({"joined": [data["user"]]})
+    elif kind == "left":
+        membership.remove(rid, data["user"])
 
+        if manager:
+            manager.broadcast_presence({"left": [data["user"]]})
+    elif kind == "presence":
+        delta = presence.apply(rid, data)
 
-async def register(ws: SocketHandshake) -> None:
-    """Register an account."""
-    username, password = await ws.expect(
-        {
-            "username": str,
-            "password": str,
-        }
+        if manager and delta:
+            manager.broadcast_presence(delta)
+    elif manager:
+        manager.apply(kind, data)
+
+
+def _on_presence(rid: int, delta: dict) -> None:
+    manager = registry.get(rid)
+
+    if manager:
+        manager.broadcast_presence(delta)
+
+
+backplane.set_handler(_on_event)
+backplane.set_peer_handler(presence.forget)
+presence.set_handler(_on_presence)
+
+
+async def _next_tag(username: str) -> int:
+    # the counter is seeded from existing users the first time a name is seen
+    rows = await db.query_raw(
+        'INSERT INTO "UserTag" (name, last) '
+        'VALUES ($1, COALESCE((SELECT max(tag) FROM "User" WHERE name = $1), 0) + 1) '
+        'ON CONFLICT (name) DO UPDATE SET last = "UserTag".last + 1 '
+        "RETURNING last",
+        username,
     )
+    return rows[0]["last"]
+
+
+@request
+class Register:
+    username: str
+    password: str
+
+
+async def register(ws: SocketHandshake, req: Register) -> None:
+    """Register an account."""
+    username, password = req.username, req.password
 
     if len(username) > 25:
         await ws.error("Name cannot exceed 25 characters.")
 
-    found = await db.user.find_many(where={"name": username})
-    tag: int = len(found) + 1
+    try:
+        hashed = await passwords.hash(password)
+    except PasswordPoolBusy:
+        await ws.error("Server is busy, try again later.")
+
+    tag = await _next_tag(username)
 
     record = await db.user.create(
         {
             "name": username,
-            "password": hasher.hash(password),
+            "password": hashed,
             "tag": tag,
         }
     )
 
+    users.put(record)
     ws.socket.user_id = record.id
     await ws.success(payload={"tag": tag})
 
 
-async def login(ws: SocketHandshake) -> None:
+@request
+class Login:
+    username: str
+    password: str
+    tag: int
+
+
+async def login(ws: SocketHandshake, req: Login) -> None:
     """Log in to an account."""
     if ws.socket.user_id:
         await ws.error("Already logged in.")
-    username, password, tag = await ws.expect(
-        {
-            "username": str,
-            "password": str,
-            "tag": int,
-        }
-    )
+    username, password, tag = req.username, req.password, req.tag
 
-    user = await db.user.find_first(
+    user = await db.user.find_unique(
         where={
-            "name": username,
-            "tag": tag,
+            "name_tag": {
+                "name": username,
+                "tag": tag,
+            },
         },
     )
 
@@ -88,20 +144,36 @@ async def login(ws: SocketHandshake) -> None:
         await ws.error("Account is restricted.")
 
     try:
-        hasher.verify(user.password, password)
-    except VerifyMismatchError:
+        valid = await passwords.verify(user.password, password)
+    except PasswordPoolBusy:
+        await ws.error("Server is busy, try again later.")
+
+    if not valid:
         await ws.error("Invalid username or password.")
 
+    if passwords.needs_rehash(user.password):
+        # the Argon2 parameters changed, this will be retried on the next login if busy
+        with suppress(PasswordPoolBusy):
+            await db.user.update(
+                {"password": await passwords.hash(password)},
+                where={"id": user.id},
+            )
+
+    if admission.user_full(user.id):
+        await ws.error("Too many connections for this account.")
+
     ws.socket.user_id = user.id
     await ws.success()
 
 
-async def create_room(ws: SocketHandshake) -> None:
+@request
+class CreateRoom:
+    name: str
+
+
+async def create_room(ws: SocketHandshake, req: CreateRoom) -> None:
     """Create a new room."""
-    name: str = await ws.expect_only(
-        {"name": str},
-        ensure_logged=True,
-    )
+    name = req.name
 
     if len(name) > 25:
         await ws.error("Name cannot exceed 25 characters.")
@@ -122,19 +194,22 @@ async def create_room(ws: SocketHandshake) -> None:
         },
         where={"id": user.id},
     )
-    ROOMS[rid] = RoomManager(rid)
+    membership.load(rid, [user.id])
+    registry.acquire(rid)
 
     await ws.success(payload={"id": rid, "code": record.code})
 
 
-async def join(ws: SocketHandshake) -> None:
+@request
+class JoinRoom:
+    code: str
+
+
+async def join(ws: SocketHandshake, req: JoinRoom) -> None:
     """Join a new room."""
-    code: str = await ws.expect_only(
-        {"code": str},
-        ensure_logged=True,
-    )
+    code = req.code
 
-    user = await ws.get_user(include={"servers": True})
+    user = await ws.get_user()
     uid: int = user.id
 
     room = await db.room.find_first(
@@ -147,55 +222,42 @@ async def join(ws: SocketHandshake) -> None:
     if not room:
         await ws.error("Invalid room code.")
 
-    if room.id in [r.id for r in (user.servers or [])]:
+    membership.load(room.id, [i.id for i in (room.users or [])])
+
+    if await membership.is_member(room.id, uid):
         await ws.error("You have already joined this room.")
 
     await db.room.update(
         {"users": references(uid, array=True)},
         where={"code": code},
-        include={
-            "users": True,
-        },
-    )
-
-    manager = await _get_manager(room.id)
-    await manager.send_message(f'"{user.name}" has joined the room.', 0)
-
-    await db.user.update(
-        {"servers": references(room.id, array=True)},
-        where={"id": uid},
     )
-
+    backplane.publish(room.id, "joined", {"user": user_dict(user)})
     await ws.success(payload={"room": room_dict(room)})
 
 
-async def leave(ws: SocketHandshake) -> None:
-    """Leave a room."""
-    rid: int = await ws.expect_only(
-        {"id": int},
-        ensure_logged=True,
-    )
+@request
+class LeaveRoom:
+    id: int
 
-    user = await ws.get_user()
-    uid: int = user.id
 
-    room = await find_room_for(rid, uid)
+async def leave(ws: SocketHandshake, req: LeaveRoom) -> None:
+    """Leave a room."""
+    rid = req.id
+    uid = await ws.get_user_id()
 
-    if not room:
+    if not await membership.is_member(rid, uid):
         await ws.error("Room does not exist.")
 
-    manager = await _get_manager(room.id)
-    await manager.send_message(f'"{user.name}" has left the room.', 0)
-
     await db.user.update(
         {"servers": references(rid, array=True, disconnect=True)},
         where={"id": uid},
     )
+    backplane.publish(rid, "left", {"user": uid})
 
     await ws.success()
 
 
-async def list_rooms(ws: SocketHandshake) -> None:
+async def list_rooms(ws: SocketHandshake, _: Empty) -> None:
     """List rooms of the current user."""
     user = await ws.get_user(
         include={
@@ -214,39 +276,50 @@ async def list_rooms(ws: SocketHandshake) -> None:
     )
 
 
-async def room_connect(ws: SocketHandshake) -> None:
-    """Connect to a room."""
-    rid = await ws.expect_only(
-        {
-            "id": int,
-        },
-        ensure_logged=True,
-    )
+@request
+class RoomConnect:
+    id: int
+    history: Optional[int] = None
+    since_seq: Optional[int] = None
+    batch: Optional[bool] = None
 
-    room = await find_room_for(rid, await ws.get_user_id())
 
-    if not room:
+async def room_connect(ws: SocketHandshake, req: RoomConnect) -> None:
+    """Connect to a room."""
+    rid, history, since_seq = req.id, req.history, req.since_seq
+
+    if not await membership.is_member(rid, await ws.get_user_id()):
         await ws.error("Invalid room ID.")
 
-    manager = await _get_manager(room.id)
-    await manager.register_handshake(ws)
+    manager = registry.acquire(rid)
+    await manager.register_handshake(
+        ws,
+        history=history,
+        since_seq=since_seq,
+        batch=bool(req.batch),
+    )
 
 
-async def logout(ws: SocketHandshake) -> None:
-    await ws.get_user_id()  # to ensure that they are authenticated already
+async def logout(ws: SocketHandshake, _: Empty) -> None:
+    uid = await ws.get_user_id()  # to ensure that they are authenticated already
+    users.invalidate(uid)
     ws.socket.user_id = None
     await ws.success()
 
 
 # the key here is the type sent by the client
 operations: Dict[str, Operation] = {
-    "register": Operation(register),
-    "login": Operation(login),
-    "createroom": Operation(create_room),
-    "joinroom": Operation(join),
-    "listrooms": Operation(list_rooms),
-    "roomconnect": Operation(room_connect),
-    "logout": Operation(logout),
-    "leaveroom": Operation(leave),
+    "register": Operation(register, Register, limit=3),
+    "login": Operation(login, Login, limit=5),
+    "createroom": Operation(create_room, CreateRoom, ensure_logged=True, limit=5),
+    "joinroom": Operation(join, JoinRoom, ensure_logged=True, limit=10),
+    "listrooms": Operation(list_rooms, limit=20),
+    "roomconnect": Operation(room_connect, RoomConnect, ensure_logged=True, limit=10, session=True),
+    "logout": Operation(logout, limit=10),
+    "leaveroom": Operation(leave, LeaveRoom, ensure_logged=True, limit=10),
 }
 """Dictionary containing resolvers for type headers."""
+
+for name, operation in operations.items():
+    operation.slot = limits.slot(name, operation.limit)
+    operation.latency = operation_latency.labels(name)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple, TypeVar
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+
+from .config import (
+    ARGON2_MEMORY_COST, ARGON2_PARALLELISM, ARGON2_TIME_COST,
+    PASSWORD_MAX_PENDING, PASSWORD_WORKERS
+)
+
+__all__ = (
+    "PasswordPoolBusy",
+    "PasswordPool",
+    "passwords",
+)
+
+T = TypeVar("T")
+
+
+class PasswordPoolBusy(Exception):
+    """Too many password operations are already waiting."""
+
+
+class PasswordPool:
+    """Class for hashing and verifying passwords off the event loop.
+
+    Argon2 releases the GIL while hashing, so a thread pool is enough to keep
+    the event loop free.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = PASSWORD_WORKERS,
+        max_pending: int = PASSWORD_MAX_PENDING,
+        time_cost: int = ARGON2_TIME_COST,
+        memory_cost: int = ARGON2_MEMORY_COST,
+        parallelism: int = ARGON2_PARALLELISM,
+    ) -> None:
+        self._hasher = PasswordHasher(
+            time_cost=time_cost,
+            memory_cost=memory_cost,
+            parallelism=parallelism,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="argon2",
+        )
+        self._max_pending = max_pending
+
+        self._pending: int = 0
+        self._completed: int = 0
+        self._rejected: int = 0
+        self._total_wait: float = 0.0
+
+    async def _run(self, fn: Callable[[], T]) -> T:
+        if self._pending >= self._max_pending:
+            self._rejected += 1
+            raise PasswordPoolBusy
+
+        queued = time.perf_counter()
+
+        def job() -> Tuple[float, T]:
+            return time.perf_counter(), fn()
+
+        self._pending += 1
+
+        try:
+            started, res = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                job,
+            )
+        finally:
+            self._pending -= 1
+
+        self._completed += 1
+        self._total_wait += started - queued
+        return res
+
+    async def hash(self, password: str) -> str:
+        """Hash a password."""
+        return await self._run(lambda: self._hasher.hash(password))
+
+    async def verify(self, hash: str, password: str) -> bool:
+        """Check a password against a hash."""
+
+        def verify() -> bool:
+            try:
+                return self._hasher.verify(hash, password)
+            except (VerificationError, InvalidHash):
+                return False
+
+        return await self._run(verify)
+
+    def needs_rehash(self, hash: str) -> bool:
+        """Whether a hash was made with different parameters than the current ones."""
+        return self._hasher.check_needs_rehash(hash)
+
+    def close(self) -> None:
+        """Shut down the worker threads."""
+        self._executor.shutdown(wait=False)
+
+    @property
+    def pending(self) -> int:
+        """Number of password operations running or waiting."""
+        return self._pending
+
+    @property
+    def completed(self) -> int:
+        """Number of finished password operations."""
+        return self._completed
+
+    @property
+    def rejected(self) -> int:
+        """Number of password operations rejected because the pool was full."""
+        return self._rejected
+
+    @property
+    def average_wait(self) -> float:
+        """Average time (in seconds) an operation waited for a worker."""
+        return self._total_wait / self._completed if self._completed else 0.0
+
+
+passwords = PasswordPool()
+"""Password pool shared by every connection."""
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from .config import (
+    MESSAGE_BATCH_SIZE, MESSAGE_FLUSH_INTERVAL, MESSAGE_QUEUE_SIZE,
+    MESSAGE_RETRY_DELAY, MESSAGE_WRITE_RETRIES
+)
+from .db import db
+
+__all__ = (
+    "PendingMessage",
+    "MessageWriter",
+    "writer",
+)
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingMessage:
+    """Dataclass for holding a message that has not been written yet."""
+
+    content: str
+    author_id: int
+    server_id: int
+    seq: int
+    created_at: datetime = field(
+        default_factory=lambda: datetime.now(timezone.utc),
+    )
+    id: Optional[int] = None
+    on_written: Optional[Callable[["PendingMessage"], None]] = None
+    on_failed: Optional[Callable[["PendingMessage"], None]] = None
+
+
+class MessageWriter:
+    """Class for writing messages to the database in batches.
+
+    A batch that fails to be written is retried with an increasing delay.
+    If every retry fails, the messages are given up and their `on_failed`
+    callback is called instead of `on_written`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_pending: int = MESSAGE_QUEUE_SIZE,
+        batch_size: int = MESSAGE_BATCH_SIZE,
+        flush_interval: float = MESSAGE_FLUSH_INTERVAL,
+        retries: int = MESSAGE_WRITE_RETRIES,
+        retry_delay: float = MESSAGE_RETRY_DELAY,
+    ) -> None:
+        self._queue: "asyncio.Queue[PendingMessage]" = asyncio.Queue(
+            maxsize=max_pending,
+        )
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: bool = False
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+
+        self._flushes: int = 0
+        self._flushed: int = 0
+        self._retried: int = 0
+        self._failed: int = 0
+        self._last_flush_latency: float = 0.0
+        self._total_flush_latency: float = 0.0
+
+    def start(self) -> None:
+        """Start flushing messages in the background."""
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Flush every pending message and stop the writer."""
+        self._stopping = True
+        self._wake.set()
+        self._full.set()
+
+        if self._task:
+            await self._task
+            self._task = None
+
+    async def put(self, message: PendingMessage) -> None:
+        """Queue a message to be written.
+
+        This only waits when the queue is full.
+        """
+        await self._queue.put(message)
+        self._wake.set()
+
+        if self._queue.qsize() >= self._batch_size:
+            self._full.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+
+            if not self._stopping:
+                # wait for either a full batch or the flush interval
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self._full.wait(),
+                        self._flush_interval,
+                    )
+
+            self._wake.clear()
+            self._full.clear()
+
+            while not self._queue.empty():
+                batch = self._take_batch()
+
+                try:
+                    await self._write(batch)
+                except Exception:
+                    # keep the writer alive for the next batches
+                    log.exception("failed to handle a batch of %d messages", len(batch))
+
+            if self._stopping:
+                return
+
+    def _take_batch(self) -> List[PendingMessage]:
+        batch: List[PendingMessage] = []
+
+        while len(batch) < self._batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    async def _write(self, batch: List[PendingMessage]) -> None:
+        # retried in place, so messages are still written in order
+        for attempt in range(self._retries + 1):
+            if attempt:
+                self._retried += 1
+                await asyncio.sleep(self._retry_delay * 2 ** (attempt - 1))
+
+            try:
+                await self._flush(batch)
+            except Exception:
+                log.exception(
+                    "failed to write %d messages (attempt %d of %d)",
+                    len(batch),
+                    attempt + 1,
+                    self._retries + 1,
+                )
+            else:
+                self._notify(batch, "on_written")
+                return
+
+        self._failed += len(batch)
+        self._notify(batch, "on_failed")
+
+    def _notify(self, batch: List[PendingMessage], callback: str) -> None:
+        # a failing callback must not stop the writer
+        for message in batch:
+            fn = getattr(message, callback)
+
+            if not fn:
+                continue
+
+            try:
+                fn(message)
+            except Exception:
+                log.exception("%s callback of message %d failed", callback, message.seq)
+
+    async def _flush(self, batch: List[PendingMessage]) -> None:
+        start = time.perf_counter()
+        values: List[str] = []
+        args: list = []
+
+        # created_at is in UTC, and casting to timestamp drops the offset
+        for index, message in enumerate(batch):
+            n = index * 5
+            values.append(
+                f"(${n + 1}, ${n + 2}, ${n + 3}, ${n + 4}::timestamp, ${n + 5}, ${n + 5})",
+            )
+            args.extend(
+                [
+                    message.content,
+                    message.author_id,
+                    message.server_id,
+                    message.created_at.isoformat(),
+                    message.seq,
+                ]
+            )
+
+        rows = await db.query_raw(
+            'INSERT INTO "Message" (content, author_id, server_id, created_at, seq, updated_seq) '
+            f"VALUES {', '.join(values)} RETURNING id",
+            *args,
+        )
+
+        for message, row in zip(batch, rows):
+            message.id = row["id"]
+
+        latency = time.perf_counter() - start
+        self._flushes += 1
+        self._flushed += len(batch)
+        self._last_flush_latency = latency
+        self._total_flush_latency += latency
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be written."""
+        return self._queue.qsize()
+
+    @property
+    def flushes(self) -> int:
+        """Number of batches written."""
+        return self._flushes
+
+    @property
+    def flushed(self) -> int:
+        """Number of messages written."""
+        return self._flushed
+
+    @property
+    def retries(self) -> int:
+        """Number of times a batch was retried."""
+        return self._retried
+
+    @property
+    def failed(self) -> int:
+        """Number of messages given up after every retry failed."""
+        return self._failed
+
+    @property
+    def last_flush_latency(self) -> float:
+        """Time (in seconds) taken by the most recent flush."""
+        return self._last_flush_latency
+
+    @property
+    def average_flush_latency(self) -> float:
+        """Average time (in seconds) taken by a flush."""
+        return self._total_flush_latency / self._flushes if self._flushes else 0.0
+
+
+writer = MessageWriter()
+"""Message writer used by every room."""
@@ -0,0 +1,234 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from contextlib import suppress
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .backplane import backplane
+from .config import PRESENCE_ANNOUNCE_INTERVAL, PRESENCE_DEBOUNCE
+
+__all__ = (
+    "Presence",
+    "presence",
+)
+
+
+class Presence:
+    """Class for tracking which users are connected to each room.
+
+    Connects and disconnects on this worker are collected for `debounce`
+    seconds and only the net change is published, so a client that drops and
+    reconnects within that window never appears to go offline. Every worker
+    applies the published changes, and a user stays online as long as any
+    worker still has them connected.
+
+    Every worker also announces its full state every `announce_interval`
+    seconds, so a new worker learns who is already online. A worker that
+    has not been heard from for `EXPIRY` announcements, or that the backplane
+    reports as gone, no longer keeps anybody online.
+    """
+
+    EXPIRY: int = 3
+
+    def __init__(self, debounce: float, announce_interval: float) -> None:
+        self._debounce = debounce
+        self._announce_interval = announce_interval
+        self._pid = os.getpid()
+        # connections on this worker, by (room, user)
+        self._connections: "Counter[Tuple[int, int]]" = Counter()
+        # users whose local state changed since the last flush, by room
+        self._pending: Dict[int, Set[int]] = {}
+        self._handles: Dict[int, asyncio.TimerHandle] = {}
+        # workers that announced each user as online, by room
+        self._online: Dict[int, Dict[int, Set[int]]] = {}
+        # when each other worker was last heard from, by room
+        self._heard: Dict[int, Dict[int, float]] = {}
+        self._handler: Optional[Callable[[int, dict], None]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._published: int = 0
+        self._expired: int = 0
+
+    def set_handler(self, handler: Callable[[int, dict], None]) -> None:
+        """Set the function that receives changes not caused by a published event."""
+        self._handler = handler
+
+    def start(self) -> None:
+        """Start announcing the full state of this worker."""
+        if backplane.shared:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop announcing."""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._announce_interval)
+            self._announce()
+            self._expire()
+
+    def connect(self, room_id: int, user_id: int) -> None:
+        """Record a connection of a user to a room on this worker."""
+        key = (room_id, user_id)
+        self._connections[key] += 1
+
+        if self._connections[key] == 1:
+            self._mark(room_id, user_id)
+
+    def disconnect(self, room_id: int, user_id: int) -> None:
+        """Record that a connection of a user to a room on this worker ended."""
+        key = (room_id, user_id)
+        self._connections[key] -= 1
+
+        if self._connections[key] <= 0:
+            del self._connections[key]
+            self._mark(room_id, user_id)
+
+    def _mark(self, room_id: int, user_id: int) -> None:
+        self._pending.setdefault(room_id, set()).add(user_id)
+
+        if room_id not in self._handles:
+            self._handles[room_id] = asyncio.get_running_loop().call_later(
+                self._debounce,
+                self._flush,
+                room_id,
+            )
+
+    def _flush(self, room_id: int) -> None:
+        del self._handles[room_id]
+        online: List[int] = []
+        offline: List[int] = []
+        announced = self._online.get(room_id, {})
+
+        for uid in self._pending.pop(room_id, ()):
+            connected = (room_id, uid) in self._connections
+            was_connected = self._pid in announced.get(uid, ())
+
+            if connected and not was_connected:
+                online.append(uid)
+            elif was_connected and not connected:
+                offline.append(uid)
+
+        if online or offline:
+            self._published += 1
+            backplane.publish(
+                room_id,
+                "presence",
+                {"pid": self._pid, "online": online, "offline": offline},
+            )
+
+    def _announce(self) -> None:
+        # only what was already published, so pending changes stay debounced
+        for room_id, room in list(self._online.items()):
+            online = [uid for uid, workers in room.items() if self._pid in workers]
+
+            if online:
+                backplane.publish(
+                    room_id,
+                    "presence",
+                    {"pid": self._pid, "full": True, "online": online, "offline": []},
+                )
+
+    def _expire(self) -> None:
+        deadline = time.monotonic() - self._announce_interval * self.EXPIRY
+
+        for room_id, heard in list(self._heard.items()):
+            for pid, last in list(heard.items()):
+                if last < deadline:
+                    self._expired += 1
+                    self._drop(room_id, pid)
+
+    def forget(self, pid: int) -> None:
+        """Drop everything announced by a worker that went away."""
+        for room_id in list(self._heard):
+            if pid in self._heard[room_id]:
+                self._drop(room_id, pid)
+
+    def _drop(self, room_id: int, pid: int) -> None:
+        heard = self._heard[room_id]
+        del heard[pid]
+
+        if not heard:
+            del self._heard[room_id]
+
+        room = self._online.get(room_id, {})
+        offline = [uid for uid, workers in room.items() if pid in workers]
+        delta = self._update(room_id, pid, [], offline)
+
+        if delta and self._handler:
+            self._handler(room_id, delta)
+
+    def apply(self, room_id: int, data: dict) -> Optional[dict]:
+        """Apply changes published by a worker.
+
+        Returns the users that came online or went offline as a result, or
+        `None` if nobody did.
+        """
+        pid: int = data["pid"]
+        offline: List[int] = data["offline"]
+
+        if pid != self._pid:
+            self._heard.setdefault(room_id, {})[pid] = time.monotonic()
+
+        if data.get("full"):
+            # a full announcement replaces whatever the worker announced before
+            announced = set(data["online"])
+            room = self._online.get(room_id, {})
+            offline = [uid for uid, workers in room.items() if pid in workers and uid not in announced]
+
+        return self._update(room_id, pid, data["online"], offline)
+
+    def _update(self, room_id: int, pid: int, online_ids: List[int], offline_ids: List[int]) -> Optional[dict]:
+        room = self._online.setdefault(room_id, {})
+        online: List[int] = []
+        offline: List[int] = []
+
+        for uid in online_ids:
+            workers = room.setdefault(uid, set())
+
+            if not workers:
+                online.append(uid)
+
+            workers.add(pid)
+
+        for uid in offline_ids:
+            found = room.get(uid)
+
+            if found is None:
+                continue
+
+            found.discard(pid)
+
+            if not found:
+                del room[uid]
+                offline.append(uid)
+
+        if not room:
+            del self._online[room_id]
+
+        if not online and not offline:
+            return None
+
+        return {"online": online, "offline": offline}
+
+    def online(self, room_id: int) -> List[int]:
+        """Get the IDs of the users connected to a room."""
+        return list(self._online.get(room_id, ()))
+
+    @property
+    def published(self) -> int:
+        """Number of presence changes published by this worker."""
+        return self._published
+
+    @property
+    def expired(self) -> int:
+        """Number of times a worker was dropped for not announcing its state."""
+        return self._expired
+
+
+presence = Presence(PRESENCE_DEBOUNCE, PRESENCE_ANNOUNCE_INTERVAL)
+"""Presence of users in rooms."""
@@ -0,0 +1,92 @@
+import time
+from array import array
+from typing import Dict, List
+
+from .config import RATE_LIMIT_PERIOD, RATE_LIMITS
+
+__all__ = (
+    "RateLimits",
+    "RateLimiter",
+    "limits",
+)
+
+
+class RateLimits:
+    """Token bucket settings shared by every connection.
+
+    Each limited request type gets a slot, and every connection keeps one
+    bucket per slot.
+    """
+
+    def __init__(self, period: float, overrides: Dict[str, int]) -> None:
+        self._period = period
+        self._overrides = overrides
+        self._names: List[str] = []
+        self._capacity = array("d")
+        self._rate = array("d")
+        self._rejected: int = 0
+
+    def slot(self, name: str, limit: int) -> int:
+        """Get the bucket slot for a request type, or -1 if it is not limited.
+
+        `limit` is the number of requests allowed per period, and is replaced
+        by the configured limit for `name` if there is one.
+        """
+        limit = self._overrides.get(name, limit)
+
+        if limit < 0:
+            return -1
+
+        if name in self._names:
+            return self._names.index(name)
+
+        self._names.append(name)
+        self._capacity.append(limit)
+        self._rate.append(limit / self._period)
+        return len(self._names) - 1
+
+    def create(self) -> "RateLimiter":
+        """Create the buckets of a new connection."""
+        return RateLimiter(self)
+
+    @property
+    def rejected(self) -> int:
+        """Number of requests rejected for exceeding their limit."""
+        return self._rejected
+
+
+class RateLimiter:
+    """Token buckets of a single connection."""
+
+    __slots__ = ("_limits", "_tokens", "_updated")
+
+    def __init__(self, limits: RateLimits) -> None:
+        self._limits = limits
+        # every bucket starts full
+        self._tokens = array("d", limits._capacity)
+        self._updated = array("d", [time.monotonic()]) * len(self._tokens)
+
+    def allow(self, slot: int) -> bool:
+        """Take a token from a bucket, returning whether the request may run."""
+        if slot < 0:
+            return True
+
+        limits = self._limits
+        now = time.monotonic()
+        tokens = min(
+            limits._capacity[slot],
+            self._tokens[slot] + (now - self._updated[slot]) * limits._rate[slot],
+        )
+        self._updated[slot] = now
+
+        if tokens < 1:
+            self._tokens[slot] = tokens
+            limits._rejected += 1
+            return False
+
+        self._tokens[slot] = tokens - 1
+        return True
+
+
+limits = RateLimits(RATE_LIMIT_PERIOD, RATE_LIMITS)
+"""Rate limits used by every connection."""
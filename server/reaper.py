@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import suppress
+from typing import TYPE_CHECKING, Optional, Set
+
+from .config import AUTH_TIMEOUT, REAP_INTERVAL
+
+if TYPE_CHECKING:
+    from .ws import Socket
+
+__all__ = (
+    "Reaper",
+    "reaper",
+)
+
+
+class Reaper:
+    """Class for removing dead and idle connections.
+
+    Half-open connections are caught by the WebSocket ping, after which the
+    socket is closed but may still sit in rooms until its receiver notices.
+    The reaper removes those from every room right away, along with sockets
+    that never authenticated within `AUTH_TIMEOUT` seconds.
+    """
+
+    def __init__(self, interval: float, auth_timeout: float) -> None:
+        self._interval = interval
+        self._auth_timeout = auth_timeout
+        self._sockets: Set[Socket] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._reaped_dead: int = 0
+        self._reaped_idle: int = 0
+
+    def add(self, socket: Socket) -> None:
+        """Start watching a connected socket."""
+        self._sockets.add(socket)
+
+    def discard(self, socket: Socket) -> None:
+        """Stop watching a socket."""
+        self._sockets.discard(socket)
+
+    def start(self) -> None:
+        """Start the reaper."""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the reaper."""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            self.reap()
+
+    def reap(self) -> int:
+        """Remove dead and idle sockets, returning how many were removed."""
+        now = time.monotonic()
+        reaped = 0
+
+        for socket in list(self._sockets):
+            if socket.closed:
+                self._reaped_dead += 1
+            elif socket.user_id is None and now - socket.last_seen > self._auth_timeout:
+                self._reaped_idle += 1
+            else:
+                continue
+
+            socket.reap()
+            self._sockets.discard(socket)
+            reaped += 1
+
+        return reaped
+
+    @property
+    def sockets(self) -> Set[Socket]:
+        """Connected sockets."""
+        return self._sockets
+
+    @property
+    def live(self) -> int:
+        """Number of connected sockets."""
+        return len(self._sockets)
+
+    @property
+    def reaped_dead(self) -> int:
+        """Number of closed sockets removed from their rooms."""
+        return self._reaped_dead
+
+    @property
+    def reaped_idle(self) -> int:
+        """Number of unauthenticated sockets closed for being idle."""
+        return self._reaped_idle
+
+
+reaper = Reaper(REAP_INTERVAL, AUTH_TIMEOUT)
+"""Reaper watching every connected socket."""
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Dict, Optional
+
+from .config import ROOM_CACHE_SIZE, ROOM_IDLE_TTL, UNWRITTEN_TIMEOUT
+from .membership import membership
+from .rooms import RoomManager
+
+__all__ = (
+    "RoomRegistry",
+    "registry",
+)
+
+
+class RoomRegistry:
+    """Registry of room managers.
+
+    Managers are created on first use and dropped, along with the room's
+    cached membership, once they are idle for `ttl` seconds or when more
+    than `max_size` managers exist. A dropped room is loaded again from the
+    database the next time it is used.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self._ttl = ttl
+        self._max_size = max_size
+        # least recently used first
+        self._rooms: "OrderedDict[int, RoomManager]" = OrderedDict()
+        self._used: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._evictions: int = 0
+        self._expired_unwritten: int = 0
+
+    def get(self, room_id: int) -> Optional[RoomManager]:
+        """Get the manager of a room, if it exists."""
+        return self._rooms.get(room_id)
+
+    def acquire(self, room_id: int) -> RoomManager:
+        """Get the manager of a room, creating it if needed."""
+        manager = self._rooms.get(room_id)
+
+        if manager:
+            self._rooms.move_to_end(room_id)
+        else:
+            manager = RoomManager(room_id)
+            self._rooms[room_id] = manager
+
+        self._used[room_id] = time.monotonic()
+
+        if len(self._rooms) > self._max_size:
+            self._shrink(keep=room_id)
+
+        return manager
+
+    def _evict(self, room_id: int) -> None:
+        del self._rooms[room_id]
+        del self._used[room_id]
+        membership.forget(room_id)
+        self._evictions += 1
+
+    def _shrink(self, keep: int) -> None:
+        excess = len(self._rooms) - self._max_size
+
+        for rid, manager in list(self._rooms.items()):
+            if excess <= 0:
+                break
+
+            # the room being acquired is idle until its handshake connects
+            if rid != keep and manager.idle:
+                self._evict(rid)
+                excess -= 1
+
+    def sweep(self) -> int:
+        """Evict managers that have been idle for too long, returning how many were evicted."""
+        now = time.monotonic()
+        evicted = 0
+
+        for rid, manager in list(self._rooms.items()):
+            self._expired_unwritten += manager.expire_unwritten(UNWRITTEN_TIMEOUT)
+
+            if not manager.idle:
+                # the idle time starts counting once the room is left alone
+                self._used[rid] = now
+            elif now - self._used[rid] > self._ttl:
+                self._evict(rid)
+                evicted += 1
+
+        return evicted
+
+    def start(self) -> None:
+        """Start evicting idle managers in the background."""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop evicting idle managers."""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._ttl / 2)
+            self.sweep()
+
+    @property
+    def size(self) -> int:
+        """Number of managers in the registry."""
+        return len(self._rooms)
+
+    @property
+    def evictions(self) -> int:
+        """Number of managers evicted."""
+        return self._evictions
+
+    @property
+    def expired_unwritten(self) -> int:
+        """Number of messages whose write was never confirmed to their room."""
+        return self._expired_unwritten
+
+
+registry = RoomRegistry(ROOM_IDLE_TTL, ROOM_CACHE_SIZE)
+"""Room managers of this process."""
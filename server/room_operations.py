@@ -1,25 +1,56 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, field
 from typing import (
-    TYPE_CHECKING, Awaitable, Callable, Dict, Literal, Optional, Union,
-    overload
+    TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Literal, Optional,
+    Type, Union, overload
 )
 
 from .db import db
+from .metrics import Histogram, action_latency
+from .presence import presence
+from .ratelimit import limits
+from .structs import Empty, request
 from .utils import message_dict
 
 if TYPE_CHECKING:
     from prisma.models import Message
+    from prisma.types import IntFilter, MessageWhereInput
 
     from .rooms import RoomManager
     from .ws import SocketHandshake
 
 __all__ = ("RECEIVER_OPERATIONS",)
 
+DEFAULT_PAGE_SIZE: int = 50
+MAX_PAGE_SIZE: int = 100
 
-async def _send_message(room: RoomManager, ws: SocketHandshake) -> None:
+
+ActionFunc = Callable[["RoomManager", "SocketHandshake", Any], Awaitable[None]]
+
+
+@dataclass
+class Action:
+    """Dataclass for holding room action information."""
+
+    fn: ActionFunc
+    request: Type[Any]
+    limit: int = -1
+    slot: int = field(default=-1, init=False)
+    latency: Histogram = field(init=False)
+
+
+@request
+class SendMessage:
     content: str
-    content = await ws.expect_only({"content": str})
+
+
+async def _send_message(
+    room: RoomManager,
+    ws: SocketHandshake,
+    req: SendMessage,
+) -> None:
+    content = req.content
 
     if len(content) > 2500:
         return await ws.error_continue(
@@ -32,41 +63,93 @@ async def _send_message(room: RoomManager, ws: SocketHandshake) -> None:
     )
 
 
-async def _get_messages(room: RoomManager, ws: SocketHandshake) -> None:
-    take: int
-    skip: int
+@request
+class GetMessages:
+    # offset paging, kept for older clients
+    take: Optional[int] = None
+    skip: Optional[int] = None
+    # cursor paging
+    before_id: Optional[int] = None
+    after_id: Optional[int] = None
+    limit: Optional[int] = None
 
-    take, skip = await ws.expect(
-        {
-            "take": int,
-            "skip": int,
-        },
-    )
 
-    record = await db.room.find_unique(
-        {
-            "id": room.id,
-        },
-        include={
-            "messages": {
-                "take": take,
-                "skip": skip,
-                "include": {"author": True},
-            }
-        },
-    )
-    assert record
+async def _get_messages(
+    room: RoomManager,
+    ws: SocketHandshake,
+    req: GetMessages,
+) -> None:
+    if req.take is not None:
+        if req.skip is None:
+            await ws.error("Payload missing keys: skip")
+
+        records = await db.message.find_many(
+            where={"server_id": room.id, "deleted": False},
+            take=req.take,
+            skip=req.skip,
+            order={"id": "asc"},
+            include={"author": True},
+        )
+        messages = [message_dict(i) for i in records]
+    else:
+        messages = await _get_messages_by_cursor(room, req)
 
     await ws.reply(
         payload={
-            "messages": [message_dict(i) for i in (record.messages or [])],
+            "messages": messages,
         }
     )
 
 
+async def _get_messages_by_cursor(
+    room: RoomManager,
+    req: GetMessages,
+) -> List[dict]:
+    before_id, after_id = req.before_id, req.after_id
+    take = min(max(req.limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+
+    cached = await room.recent_messages(
+        before_id=before_id,
+        after_id=after_id,
+        limit=take,
+    )
+
+    if cached is not None:
+        return cached
+
+    where: MessageWhereInput = {"server_id": room.id, "deleted": False}
+    id_filter: IntFilter = {}
+
+    if before_id is not None:
+        id_filter["lt"] = before_id
+
+    if after_id is not None:
+        id_filter["gt"] = after_id
+
+    if id_filter:
+        where["id"] = id_filter
+
+    # without an after_id cursor, the newest messages are wanted
+    newest_first = after_id is None
+
+    records = await db.message.find_many(
+        where=where,
+        take=take,
+        order={"id": "desc" if newest_first else "asc"},
+        include={"author": True},
+    )
+
+    if newest_first:
+        records.reverse()
+
+    return [message_dict(i) for i in records]
+
+
 @overload
 async def _handle_message_lookup(
+    room: RoomManager,
     ws: SocketHandshake,
+    mid: int,
     *,
     return_id: Literal[False] = False,
 ) -> Optional[Message]:
@@ -75,7 +158,9 @@ async def _handle_message_lookup(
 
 @overload
 async def _handle_message_lookup(
+    room: RoomManager,
     ws: SocketHandshake,
+    mid: int,
     *,
     return_id: Literal[True] = True,
 ) -> Optional[int]:
@@ -83,25 +168,21 @@ async def _handle_message_lookup(
 
 
 async def _handle_message_lookup(
+    room: RoomManager,
     ws: SocketHandshake,
+    mid: int,
     *,
     return_id: bool = False,
 ) -> Optional[Union[Message, int]]:
-    mid = await ws.expect_only(
-        {
-            "mid": int,
-        }
-    )
-
     message = await db.message.find_unique({"id": mid})
 
-    if not message:
+    if not message or message.deleted or message.server_id != room.id:
         await ws.error_continue(
             "Message not found.",
         )
         return None  # mypy is getting angry
 
-    uid = ws.get_user_id()
+    uid = await ws.get_user_id()
 
     if not message.author_id == uid:
         await ws.error_continue(
@@ -112,45 +193,66 @@ async def _handle_message_lookup(
     return message if not return_id else mid
 
 
-async def _edit(room: RoomManager, ws: SocketHandshake) -> None:
-    mid = await _handle_message_lookup(ws, return_id=True)
+@request
+class EditMessage:
+    mid: int
+    content: str
+
+
+async def _edit(
+    room: RoomManager,
+    ws: SocketHandshake,
+    req: EditMessage,
+) -> None:
+    mid = await _handle_message_lookup(room, ws, req.mid, return_id=True)
 
     if not mid:
         return  # pass back the error
 
-    content = await ws.expect_only({"content": str})
+    content = req.content
 
     if len(content) > 2500:
         return await ws.error_continue(
             "Content cannot exceed 2500 characters.",
         )
 
-    await db.message.update(
-        {"content": content},
-        where={"id": mid},
-    )
     await room.update_message(mid, content)
 
 
-async def _delete(room: RoomManager, ws: SocketHandshake) -> None:
-    mid = await _handle_message_lookup(ws, return_id=True)
+@request
+class DeleteMessage:
+    mid: int
+
+
+async def _delete(
+    room: RoomManager,
+    ws: SocketHandshake,
+    req: DeleteMessage,
+) -> None:
+    mid = await _handle_message_lookup(room, ws, req.mid, return_id=True)
 
     if not mid:
         return
 
-    await db.message.delete({"id": mid})
     await room.delete_message(mid)
 
 
-RECEIVER_OPERATIONS: Dict[
-    str,
-    Callable[
-        [RoomManager, SocketHandshake],
-        Awaitable[None],
-    ],
-] = {
-    "send": _send_message,
-    "getmessages": _get_messages,
-    "edit": _edit,
-    "delete": _delete,
+async def _online(
+    room: RoomManager,
+    ws: SocketHandshake,
+    _: Empty,
+) -> None:
+    await ws.reply(payload={"online": presence.online(room.id)})
+
+
+RECEIVER_OPERATIONS: Dict[str, Action] = {
+    "send": Action(_send_message, SendMessage, limit=20),
+    "getmessages": Action(_get_messages, GetMessages, limit=20),
+    "edit": Action(_edit, EditMessage, limit=20),
+    "delete": Action(_delete, DeleteMessage, limit=20),
+    "online": Action(_online, Empty, limit=20),
 }
+
+for name, action in RECEIVER_OPERATIONS.items():
+    action.slot = limits.slot(name, action.limit)
+    action.latency = action_latency.labels(name)
@@ -1,14 +1,32 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, List, Union
+import asyncio
+import bisect
+import os
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING, Deque, Dict, List, Optional, Set, Tuple, Union
+)
 
 from fastapi import WebSocketDisconnect
 
+from .backplane import backplane
+from .config import (
+    COALESCE_BUSY_WINDOW, COALESCE_RATE, COALESCE_WINDOW, EVENT_LOG_SIZE,
+    RECENT_MESSAGES
+)
 from .db import db
-from .utils import EndHandshake, references, user_dict
+from .frames import Frame
+from .metrics import fanout_latency
+from .persistence import PendingMessage, writer
+from .presence import presence
+from .structs import RoomAction
+from .users import UserRecord, users
+from .utils import EndHandshake, message_dict, user_dict
 
 if TYPE_CHECKING:
-    from .ws import SocketHandshake
+    from .ws import Socket, SocketHandshake
     from prisma.models import Room, User
 
 from .room_operations import RECEIVER_OPERATIONS
@@ -26,6 +44,42 @@ class RoomManager:
         self._id = room_id
         self._connected: List[SocketHandshake] = []
 
+        # newest messages in the room, oldest first
+        # messages that haven't been written yet have an id of None
+        self._recent: Deque[dict] = deque(maxlen=RECENT_MESSAGES)
+        self._recent_loaded: bool = False
+        self._recent_complete: bool = False
+        self._recent_lock = asyncio.Lock()
+
+        # messages that are still waiting to be written, by event key
+        # holds their sequence number, logged event, recent buffer entry (if any) and when they were sent
+        self._unwritten: Dict[str, Tuple[int, dict, Optional[dict], float]] = {}
+        self._counter: int = 0
+
+        # latest sequence number, and every event after _log_floor
+        self._seq: int = 0
+        self._seq_loaded: bool = False
+        self._seq_lock = asyncio.Lock()
+        self._log: List[Tuple[int, dict]] = []
+        self._log_floor: int = 0
+
+        # operations that allocated a sequence number which isn't stored yet
+        self._busy: int = 0
+        # handshakes that are connecting, and not in _connected yet
+        self._joining: int = 0
+
+        # events waiting to be sent in a single batch frame, see _broadcast
+        # None picks the window from the config and the rate of events
+        self.coalesce_window: Optional[float] = None
+        self._rate_start: float = 0.0
+        self._rate_events: int = 0
+        self._batched: Set[SocketHandshake] = set()
+
+        # users of the connected handshakes, used for presence
+        self._users: Dict[SocketHandshake, int] = {}
+        self._pending: List[Tuple[str, dict]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
     async def _lookup(self) -> Room:
         room = await db.room.find_unique(
             {"id": self.id},
@@ -34,45 +88,256 @@ class RoomManager:
 
         return room
 
+    async def _load_recent(self) -> None:
+        if self._recent_loaded:
+            return
+
+        async with self._recent_lock:
+            if self._recent_loaded:
+                return
+
+            maxlen = self._recent.maxlen
+            assert maxlen is not None
+
+            records = await db.message.find_many(
+                where={"server_id": self.id, "deleted": False},
+                take=maxlen,
+                order={"id": "desc"},
+                include={"author": True},
+            )
+            records.reverse()
+
+            self._recent.extend(message_dict(i) for i in records)
+            self._recent_complete = len(records) < maxlen
+            self._recent_loaded = True
+
+    async def recent_messages(
+        self,
+        *,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int,
+    ) -> Optional[List[dict]]:
+        """Get messages from the recent message buffer.
+
+        Returns `None` if the buffer can't fully satisfy the request.
+        """
+        if limit < 1:
+            return []
+
+        await self._load_recent()
+        entries = list(self._recent)
+
+        if before_id is not None:
+            entries = [
+                i for i in entries if i["id"] is not None and i["id"] < before_id
+            ]
+
+        if after_id is None:
+            if len(entries) >= limit:
+                return entries[-limit:]
+
+            return entries if self._recent_complete else None
+
+        oldest = next(
+            (i["id"] for i in self._recent if i["id"] is not None),
+            None,
+        )
+
+        # the buffer must reach back to the cursor to know what came after it
+        if not self._recent_complete and (oldest is None or oldest > after_id):
+            return None
+
+        # unwritten messages are left out, like the database would
+        return [i for i in entries if i["id"] is not None and i["id"] > after_id][:limit]
+
+    def _remember(self, entry: dict) -> None:
+        if len(self._recent) == self._recent.maxlen:
+            self._recent_complete = False
+
+        self._recent.append(entry)
+
+    async def _load_seq(self) -> None:
+        if self._seq_loaded:
+            return
+
+        async with self._seq_lock:
+            if self._seq_loaded:
+                return
+
+            rows = await db.query_raw(
+                "SELECT GREATEST(seq, COALESCE("
+                '(SELECT max(updated_seq) FROM "Message" WHERE server_id = $1), 0'
+                ') AS seq FROM "Room" WHERE id = $1',
+                self.id,
+            )
+            seq: int = rows[0]["seq"] if rows else 0
+
+            self._seq = max(self._seq, seq)
+            self._log_floor = self._seq
+            self._seq_loaded = True
+
+    async def _next_seq(self) -> int:
+        await self._load_seq()
+
+        if not backplane.shared:
+            self._seq += 1
+            return self._seq
+
+        # other workers allocate from the same room, so the database decides
+        rows = await db.query_raw(
+            'UPDATE "Room" SET seq = GREATEST(seq, $2) + 1 WHERE id = $1 RETURNING seq',
+            self.id,
+            self._seq,
+        )
+        return rows[0]["seq"]
+
+    @property
+    def seq(self) -> int:
+        """Latest sequence number of the room."""
+        return self._seq
+
+    def _log_event(self, seq: int, event: dict) -> None:
+        self._seq = max(self._seq, seq)
+
+        # events published before this room was loaded are already in the database
+        if not self._seq_loaded or seq <= self._log_floor:
+            return
+
+        # events can be published slightly out of order (e.g. by other workers)
+        bisect.insort(self._log, (seq, event), key=lambda i: i[0])
+
+        self._trim_log()
+
+    def _trim_log(self) -> None:
+        # the floor never passes an unwritten message, as it isn't in the database yet
+        unwritten = min((i[0] for i in self._unwritten.values()), default=None)
+
+        while len(self._log) > EVENT_LOG_SIZE and (unwritten is None or self._log[0][0] < unwritten):
+            self._log_floor = self._log.pop(0)[0]
+
+    async def missed_events(self, since_seq: int) -> List[dict]:
+        """Get every event after a sequence number.
+
+        Events that are no longer in memory are rebuilt from the database, so
+        a message edited several times only shows up once.
+        """
+        await self._load_seq()
+        events: List[dict] = []
+        # messages rebuilt from the database with their current state
+        covered: Set[int] = set()
+
+        while since_seq < self._log_floor:
+            floor = self._log_floor
+            events.extend(await self._missed_from_db(since_seq, floor, covered))
+            since_seq = floor
+
+        for seq, event in self._log:
+            if seq <= since_seq:
+                continue
+
+            # later changes to a rebuilt message are already part of it
+            change = event.get("update") or event.get("delete")
+
+            if change and change["id"] in covered:
+                continue
+
+            events.append(event)
+
+        return events
+
+    async def _missed_from_db(self, since_seq: int, until_seq: int, covered: Set[int]) -> List[dict]:
+        # messages created in the range are included even if they changed after it
+        records = await db.message.find_many(
+            where={
+                "server_id": self.id,
+                "OR": [
+                    {"updated_seq": {"gt": since_seq, "lte": until_seq}},
+                    {"seq": {"gt": since_seq, "lte": until_seq}},
+                ],
+            },
+            order={"updated_seq": "asc"},
+            include={"author": True},
+        )
+        events: List[dict] = []
+
+        for i in records:
+            if i.id in covered:
+                continue
+
+            if i.seq > since_seq:
+                # the client never saw it, so send it as it is now (or not at all if deleted)
+                covered.add(i.id)
+
+                if not i.deleted:
+                    events.append({"new": message_dict(i)})
+            elif i.deleted:
+                events.append({"delete": {"id": i.id, "seq": i.updated_seq}})
+            else:
+                events.append(
+                    {
+                        "update": {
+                            "id": i.id,
+                            "content": i.content,
+                            "seq": i.updated_seq,
+                        }
+                    }
+                )
+
+        return events
+
     async def send_message(
         self,
         message: str,
-        author: Union[User, int],
+        author: Union[User, UserRecord, int],
     ) -> None:
         """Send a message in a room."""
         au = (
             author
             if not isinstance(author, int)
-            else await db.user.find_unique({"id": author})
+            else await users.get(author)
         )
         assert au
 
-        for i in self._connected:
-            await i.reply(
-                message="New message received.",
-                payload={
-                    "new": {
-                        "author": user_dict(au),
-                        "content": message,
-                    },
+        await self._load_recent()
+        self._busy += 1
+
+        try:
+            pending = PendingMessage(
+                content=message,
+                author_id=au.id,
+                server_id=self.id,
+                seq=await self._next_seq(),
+            )
+            self._counter += 1
+            key = f"{os.getpid()}:{self._counter}"
+            pending.on_written = lambda written: backplane.publish(
+                self.id,
+                "written",
+                {"key": key, "id": written.id},
+            )
+            pending.on_failed = lambda failed: backplane.publish(
+                self.id,
+                "failed",
+                {"key": key, "seq": failed.seq},
+            )
+
+            backplane.publish(
+                self.id,
+                "new",
+                {
+                    "key": key,
+                    "author": user_dict(au),
+                    "content": message,
+                    "created_at": pending.created_at.timestamp(),
+                    "seq": pending.seq,
                 },
             )
 
-        record = await db.message.create(
-            {
-                "content": message,
-                "author": references(au.id),
-                "server": references(self.id),
-            }
-        )
-        await db.room.update(
-            {"messages": references(record.id, array=True)},
-            where={"id": self.id},
-        )
-        await db.user.update(
-            {"messages": references(record.id)},
-            where={"id": au.id},
-        )
+            # the message is written in the background, see persistence.py
+            await writer.put(pending)
+        finally:
+            self._busy -= 1
 
     async def update_message(
         self,
@@ -80,39 +345,330 @@ class RoomManager:
         new_content: str,
     ) -> None:
         """Update a message in a room."""
-        for i in self._connected:
-            await i.reply(
-                message="Message was updated.",
-                payload={
-                    "update": {
-                        "id": message_id,
-                        "content": new_content,
-                    },
-                },
+        self._busy += 1
+
+        try:
+            seq = await self._next_seq()
+            await db.message.update(
+                {"content": new_content, "updated_seq": seq},
+                where={"id": message_id},
             )
+        finally:
+            self._busy -= 1
+
+        backplane.publish(
+            self.id,
+            "update",
+            {"id": message_id, "content": new_content, "seq": seq},
+        )
 
     async def delete_message(self, message_id: int) -> None:
         """Delete a message in a room."""
-        for i in self._connected:
-            await i.reply(
-                message="Message was deleted.",
-                payload={
-                    "delete": {
-                        "id": message_id,
-                    },
-                },
+        # deleted messages are kept so reconnecting clients can be told about it
+        self._busy += 1
+
+        try:
+            seq = await self._next_seq()
+            await db.message.update(
+                {"deleted": True, "updated_seq": seq},
+                where={"id": message_id},
+            )
+        finally:
+            self._busy -= 1
+
+        backplane.publish(self.id, "delete", {"id": message_id, "seq": seq})
+
+    def apply(self, kind: str, data: dict) -> None:
+        """Apply an event received through the backplane."""
+        if kind == "new":
+            self._on_new(data)
+        elif kind == "written":
+            self._on_written(data)
+        elif kind == "failed":
+            self._on_failed(data)
+        elif kind == "update":
+            self._on_update(data)
+        elif kind == "delete":
+            self._on_delete(data)
+
+    def _on_new(self, data: dict) -> None:
+        entry = {
+            "id": None,
+            "content": data["content"],
+            "created_at": data["created_at"],
+            "author": data["author"],
+            "seq": data["seq"],
+        }
+        new = {
+            "author": data["author"],
+            "content": data["content"],
+            "seq": data["seq"],
+        }
+        # the logged copy gets the id once written, like events rebuilt from the database
+        logged = dict(new)
+        self._log_event(data["seq"], {"new": logged})
+
+        # rooms that haven't loaded the buffer will get this from the database
+        if self._recent_loaded:
+            self._remember(entry)
+
+        self._unwritten[data["key"]] = (
+            data["seq"],
+            logged,
+            entry if self._recent_loaded else None,
+            time.monotonic(),
+        )
+
+        self._broadcast("New message received.", {"new": new})
+
+    def _on_written(self, data: dict) -> None:
+        unwritten = self._unwritten.pop(data["key"], None)
+
+        if unwritten:
+            _, logged, entry, _ = unwritten
+            logged["id"] = data["id"]
+
+            if entry:
+                entry["id"] = data["id"]
+
+            self._trim_log()
+
+    def _on_failed(self, data: dict) -> None:
+        # the message was given up by the writer, so it won't ever have an id
+        unwritten = self._unwritten.pop(data["key"], None)
+
+        if unwritten:
+            _, _, entry, _ = unwritten
+
+            if entry and entry in self._recent:
+                self._recent.remove(entry)
+
+        self._log = [i for i in self._log if i[0] != data["seq"]]
+        self._trim_log()
+
+    def expire_unwritten(self, timeout: float) -> int:
+        """Stop waiting for messages that should have been written long ago.
+
+        Their "written" or "failed" event was lost (e.g. dropped by the
+        backplane), so the recent buffer can't be trusted anymore and is
+        reloaded from the database on next use. Returns how many expired.
+        """
+        deadline = time.monotonic() - timeout
+        expired = [key for key, i in self._unwritten.items() if i[3] < deadline]
+
+        if not expired:
+            return 0
+
+        for key in expired:
+            del self._unwritten[key]
+
+        for key, (seq, logged, _, since) in self._unwritten.items():
+            self._unwritten[key] = (seq, logged, None, since)
+
+        self._recent.clear()
+        self._recent_loaded = False
+        self._recent_complete = False
+        self._trim_log()
+        return len(expired)
+
+    def _on_update(self, data: dict) -> None:
+        self._log_event(data["seq"], {"update": data})
+
+        for i in self._recent:
+            if i["id"] == data["id"]:
+                i["content"] = data["content"]
+
+        self._broadcast("Message was updated.", {"update": data})
+
+    def _on_delete(self, data: dict) -> None:
+        self._log_event(data["seq"], {"delete": data})
+
+        for i in self._recent:
+            if i["id"] == data["id"]:
+                self._recent.remove(i)
+                break
+
+        self._broadcast("Message was deleted.", {"delete": data})
+
+    def _window(self) -> float:
+        """Count an event, returning how long to collect it for."""
+        if self.coalesce_window is not None:
+            return self.coalesce_window
+
+        now = time.monotonic()
+
+        if now - self._rate_start >= 1:
+            self._rate_start = now
+            self._rate_events = 0
+
+        self._rate_events += 1
+
+        if COALESCE_RATE > 0 and self._rate_events > COALESCE_RATE:
+            return max(COALESCE_WINDOW, COALESCE_BUSY_WINDOW)
+
+        return COALESCE_WINDOW
+
+    def _broadcast(self, message: str, event: dict) -> None:
+        window = self._window()
+
+        # events never overtake the ones waiting for a flush
+        if not self._pending and (window <= 0 or not self._batched):
+            self._send_frame(Frame.encode(message=message, payload=event))
+            return
+
+        # events within the window are sent together to clients that accept batches
+        self._pending.append((message, event))
+
+        if not self._flush_handle:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                window,
+                self._flush,
             )
 
+    def _flush(self) -> None:
+        self._flush_handle = None
+        pending, self._pending = self._pending, []
+
+        if len(pending) == 1:
+            message, event = pending[0]
+            self._send_frame(Frame.encode(message=message, payload=event))
+            return
+
+        batch = Frame.encode(
+            message="New events received.",
+            payload={"batch": [event for _, event in pending]},
+        )
+        singles: Optional[List[Frame]] = None
+        start = time.perf_counter()
+
+        for i in self._connected:
+            if i in self._batched:
+                i.queue_frame(batch)
+                continue
+
+            if singles is None:
+                singles = [Frame.encode(message=m, payload=e) for m, e in pending]
+
+            for frame in singles:
+                i.queue_frame(frame)
+
+        fanout_latency.observe(time.perf_counter() - start)
+
+    def _send_frame(self, frame: Frame) -> None:
+        start = time.perf_counter()
+
+        for i in self._connected:
+            i.queue_frame(frame)
+
+        fanout_latency.observe(time.perf_counter() - start)
+
+    def broadcast_presence(self, delta: dict) -> None:
+        """Send a presence change to everyone connected to the room."""
+        if self._flush_handle:
+            # after the events that happened before it
+            self._flush_handle.cancel()
+            self._flush()
+
+        self._send_frame(
+            Frame.encode(message="Presence changed.", payload={"presence": delta}),
+        )
+
+    def _connect(self, ws: SocketHandshake, uid: int, batch: bool) -> None:
+        self._connected.append(ws)
+        self._users[ws] = uid
+        ws.socket.rooms.add(self)
+        presence.connect(self.id, uid)
+
+        if batch:
+            self._batched.add(ws)
+
+    def _disconnect(self, ws: SocketHandshake) -> None:
+        # the reaper may have removed it already
+        if ws not in self._connected:
+            return
+
+        self._connected.remove(ws)
+        self._batched.discard(ws)
+        ws.socket.rooms.discard(self)
+        presence.disconnect(self.id, self._users.pop(ws))
+
+    def discard(self, socket: Socket) -> None:
+        """Remove every handshake of a socket from the room."""
+        for i in [i for i in self._connected if i.socket is socket]:
+            self._disconnect(i)
+
+        socket.rooms.discard(self)
+
+    @property
+    def connected(self) -> int:
+        """Number of handshakes connected to the room."""
+        return len(self._connected)
+
+    @property
+    def idle(self) -> bool:
+        """Whether the room can be dropped without losing anything.
+
+        Idle rooms have nobody connected or connecting, and every message and
+        sequence number they handed out has been written to the database.
+        """
+        return (
+            not self._connected
+            and not self._joining
+            and not self._unwritten
+            and not self._busy
+            and not self._pending
+        )
+
     @property
     def id(self) -> int:
         """ID of the room."""
         return self._id
 
-    async def register_handshake(self, socket: SocketHandshake) -> None:
-        """Add a socket to the connected handshakes."""
-        self._connected.append(socket)
+    async def register_handshake(
+        self,
+        socket: SocketHandshake,
+        *,
+        history: Optional[int] = None,
+        since_seq: Optional[int] = None,
+        batch: bool = False,
+    ) -> None:
+        """Add a socket to the connected handshakes.
+
+        If `history` is passed, up to that many recent messages are sent along
+        with the connection response. If `since_seq` is passed, every event
+        after that sequence number is sent along with it as well. If `batch`
+        is true, the socket accepts batch frames when the room coalesces events.
+        """
+        # keeps the registry from dropping the room before the socket is connected
+        self._joining += 1
+
+        try:
+            uid = await socket.get_user_id()
+            payload: dict = {}
+
+            if history is not None and history > 0:
+                payload["messages"] = await self.recent_messages(
+                    limit=min(history, RECENT_MESSAGES),
+                ) or list(self._recent)
+
+            if since_seq is not None:
+                payload["missed"] = await self.missed_events(since_seq)
+            else:
+                await self._load_seq()
+
+            # no awaits from here on, so no event can be missed or sent twice
+            if self._flush_handle:
+                # pending events are already counted in the sequence number below
+                self._flush_handle.cancel()
+                self._flush()
+
+            payload["online"] = presence.online(self.id)
+            payload["seq"] = self._seq
+            socket.queue_reply(message="Connection established.", payload=payload)
+            self._connect(socket, uid, batch)
+        finally:
+            self._joining -= 1
 
-        await socket.reply(message="Connection established.")
         await self._setup_receiver(socket)
 
     async def _setup_receiver(
@@ -121,9 +677,9 @@ class RoomManager:
     ) -> None:
         while True:
             try:
-                (action,) = await ws.receive_next({"action": str})
+                action = (await ws.receive_next(RoomAction)).action
             except (WebSocketDisconnect, EndHandshake) as e:
-                self._connected.remove(ws)
+                self._disconnect(ws)
                 raise e
 
             caller = RECEIVER_OPERATIONS.get(action)
@@ -132,9 +688,17 @@ class RoomManager:
                 await ws.error_continue("Invalid action.")
                 continue
 
+            if not ws.socket.limiter.allow(caller.slot):
+                await ws.error_continue("Too many requests, slow down.")
+                continue
+
+            start = time.perf_counter()
+
             try:
-                await caller(self, ws)
+                await caller.fn(self, ws, await ws.expect(caller.request))
             except EndHandshake as e:
                 # maybe make this catch WebSocketDisconnect as well?
-                self._connected.remove(ws)
+                self._disconnect(ws)
                 raise e
+            finally:
+                caller.latency.observe(time.perf_counter() - start)
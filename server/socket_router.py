@@ -1,9 +1,10 @@
-import copy
+import time
 from contextlib import suppress
 
-from argon2 import PasswordHasher
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from .admission import admission
+from .codec import Codec, negotiate
 from .operations import operations
 from .utils import EndHandshake
 from .ws import Socket
@@ -11,28 +12,75 @@ from .ws import Socket
 __all__ = ("router",)
 
 router = APIRouter()
-hasher = PasswordHasher()
+
+
+async def _shed(raw_socket: WebSocket, codec: Codec, retry_after: float) -> None:
+    # the connection is accepted only to tell the client when to come back
+    await raw_socket.accept(subprotocol=codec.subprotocol)
+    data = codec.encode(
+        {
+            "type": "connect",
+            "message": "Server is busy, try again later.",
+            "done": True,
+            "success": False,
+            "retry_after": retry_after,
+        }
+    )
+
+    if isinstance(data, bytes):
+        await raw_socket.send_bytes(data)
+    else:
+        await raw_socket.send_text(data)
+
+    # 1013 is "Try Again Later"
+    await raw_socket.close(1013, f"retry after {retry_after}")
 
 
 @router.websocket("/ws")
 async def socket(raw_socket: WebSocket):
     """Main socket for handling client-server communication."""
+    codec = negotiate(raw_socket.scope.get("subprotocols", []))
+    ip = raw_socket.client.host if raw_socket.client else "unknown"
+    retry_after = admission.admit(ip)
+
+    if retry_after is not None:
+        with suppress(Exception):
+            await _shed(raw_socket, codec, retry_after)
+        return
+
     ws = Socket(raw_socket)
-    await ws.connect()
 
-    ops = copy.deepcopy(operations)
+    try:
+        await ws.connect(codec)
+
+        with suppress(WebSocketDisconnect):
+            while True:
+                try:
+                    handshake = await ws.accept()
+                except EndHandshake:
+                    continue
+
+                operation = operations.get(handshake.handshake_type)
 
-    with suppress(WebSocketDisconnect):
-        while True:
-            try:
-                handshake = await ws.accept()
-            except EndHandshake:
-                continue
+                if not operation:
+                    await handshake.error("Invalid type was passed.")
 
-            operation = ops.get(handshake.handshake_type)
+                if not ws.limiter.allow(operation.slot):
+                    await handshake.error_continue("Too many requests, slow down.")
+                    continue
 
-            if not operation:
-                await handshake.error("Invalid type was passed.")
+                start = time.perf_counter()
 
-            with suppress(EndHandshake):
-                await operation.fn(handshake)
+                try:
+                    with suppress(EndHandshake):
+                        req = await handshake.expect(
+                            operation.request,
+                            ensure_logged=operation.ensure_logged,
+                        )
+                        await operation.fn(handshake, req)
+                finally:
+                    end = handshake.replied if operation.session else None
+                    operation.latency.observe((end or time.perf_counter()) - start)
+    finally:
+        await ws.cleanup()
+        admission.release(ip)
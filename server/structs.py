@@ -0,0 +1,133 @@
+from dataclasses import dataclass, fields
+from typing import (
+    Any, Dict, Generic, List, Optional, Tuple, Type, TypeVar, Union, get_args,
+    get_origin, get_type_hints
+)
+
+__all__ = (
+    "InvalidPayload",
+    "Schema",
+    "request",
+    "schema_of",
+    "Empty",
+    "Handshake",
+    "RoomAction",
+)
+
+T = TypeVar("T")
+
+
+class InvalidPayload(Exception):
+    """Raised when a payload does not match its request struct."""
+
+    def __init__(self, message: str, *, missing: bool = False) -> None:
+        super().__init__(message)
+        self.message = message
+        self.missing = missing
+
+
+class Schema(Generic[T]):
+    """Validator compiled from a request struct.
+
+    Each field is checked with a single lookup into the payload, and the
+    struct is only built once every field passed.
+    """
+
+    __slots__ = ("_struct", "_fields")
+
+    def __init__(self, struct: Type[T]) -> None:
+        self._struct = struct
+        hints = get_type_hints(struct)
+        compiled: List[Tuple[str, type, bool, str]] = []
+
+        for field in fields(struct):  # type: ignore
+            ntype = hints[field.name]
+            required = True
+
+            # Optional[X] fields may be left out, everything else is required
+            if get_origin(ntype) is Union:
+                args = [i for i in get_args(ntype) if i is not type(None)]  # noqa: E721
+                assert len(args) == 1, "only Optional unions are supported"
+                ntype = args[0]
+                required = False
+
+            compiled.append(
+                (
+                    field.name,
+                    ntype,
+                    required,
+                    f'"{field.name}" got wrong type: expected {ntype.__name__}, got ',
+                )
+            )
+
+        self._fields: Tuple[Tuple[str, type, bool, str], ...] = tuple(compiled)
+
+    @property
+    def struct(self) -> Type[T]:
+        """Struct built by this schema."""
+        return self._struct
+
+    def validate(self, payload: dict) -> T:
+        """Build the struct from a payload, raising `InvalidPayload` if it does not match."""
+        values: List[Any] = []
+        missing: Optional[List[str]] = None
+        wrong: Optional[str] = None
+
+        for name, ntype, required, expected in self._fields:
+            value = payload.get(name)
+
+            if value is None:
+                if required:
+                    if missing is None:
+                        missing = []
+                    missing.append(name)
+            elif wrong is None and not isinstance(value, ntype):
+                wrong = expected + type(value).__name__
+
+            values.append(value)
+
+        if missing:
+            raise InvalidPayload(
+                f"Payload missing keys: {', '.join(missing)}",
+                missing=True,
+            )
+
+        if wrong:
+            raise InvalidPayload(wrong)
+
+        return self._struct(*values)
+
+
+_SCHEMAS: Dict[type, Schema] = {}
+
+
+def request(cls: Type[T]) -> Type[T]:
+    """Declare a request struct and compile its schema."""
+    struct = dataclass(slots=True)(cls)  # type: ignore
+    _SCHEMAS[struct] = Schema(struct)
+    return struct
+
+
+def schema_of(struct: Type[T]) -> "Schema[T]":
+    """Get the compiled schema of a request struct."""
+    return _SCHEMAS[struct]
+
+
+@request
+class Empty:
+    """Request without any fields."""
+
+
+@request
+class Handshake:
+    """Header sent with every handshake."""
+
+    type: str
+
+
+@request
+class RoomAction:
+    """Header sent with every message to a connected room."""
+
+    action: str
+    type: str
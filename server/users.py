@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Tuple, Union
+
+from .config import USER_CACHE_SIZE, USER_CACHE_TTL
+from .db import db
+
+if TYPE_CHECKING:
+    from prisma.models import User
+
+__all__ = (
+    "UserRecord",
+    "UserCache",
+    "users",
+)
+
+
+class UserRecord(NamedTuple):
+    """Slim, immutable copy of the public fields of a user."""
+
+    id: int
+    name: str
+    tag: int
+
+    @classmethod
+    def from_model(cls, user: Union[User, UserRecord]) -> UserRecord:
+        """Make a record from a Prisma user."""
+        return cls(user.id, user.name, user.tag)
+
+
+class UserCache:
+    """Per-process cache of user records."""
+
+    def __init__(
+        self,
+        *,
+        ttl: float = USER_CACHE_TTL,
+        max_size: int = USER_CACHE_SIZE,
+    ) -> None:
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries: Dict[int, Tuple[float, UserRecord]] = {}
+        self._pinned: Dict[int, UserRecord] = {}
+        self._hits: int = 0
+        self._misses: int = 0
+
+    def pin(self, user: Union[User, UserRecord]) -> UserRecord:
+        """Permanently cache a user."""
+        record = UserRecord.from_model(user)
+        self._pinned[record.id] = record
+        return record
+
+    def put(self, user: Union[User, UserRecord]) -> UserRecord:
+        """Cache a user until the TTL expires."""
+        record = UserRecord.from_model(user)
+        self._entries.pop(record.id, None)
+
+        if len(self._entries) >= self._max_size:
+            # dicts keep insertion order, so this is the oldest entry
+            del self._entries[next(iter(self._entries))]
+
+        self._entries[record.id] = (time.monotonic() + self._ttl, record)
+        return record
+
+    def invalidate(self, user_id: int) -> None:
+        """Remove a user from the cache."""
+        self._entries.pop(user_id, None)
+
+    async def get(self, user_id: int) -> Optional[UserRecord]:
+        """Get a user, only querying the database on a cache miss."""
+        pinned = self._pinned.get(user_id)
+
+        if pinned:
+            self._hits += 1
+            return pinned
+
+        entry = self._entries.get(user_id)
+
+        if entry and entry[0] > time.monotonic():
+            self._hits += 1
+            return entry[1]
+
+        self._misses += 1
+        user = await db.user.find_unique({"id": user_id})
+
+        if not user:
+            self.invalidate(user_id)
+            return None
+
+        return self.put(user)
+
+    @property
+    def size(self) -> int:
+        """Number of cached users."""
+        return len(self._entries) + len(self._pinned)
+
+    @property
+    def hits(self) -> int:
+        """Number of lookups served from the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of lookups that went to the database."""
+        return self._misses
+
+
+users = UserCache()
+"""User cache shared by every connection."""
@@ -1,48 +1,37 @@
 from __future__ import annotations
 
-import json
 import random
 import string
-from typing import TYPE_CHECKING, Any, Dict, List, NoReturn, Optional
-
-from fastapi import WebSocket
+from typing import (
+    TYPE_CHECKING, Any, Dict, NoReturn, Optional, Tuple, Type, TypeVar, Union
+)
 
-from .db import db
+from .structs import Handshake, InvalidPayload, schema_of
 
 if TYPE_CHECKING:
     from prisma.models import Message, Room, User
 
+    from .users import UserRecord
+    from .ws import Socket
+
 __all__ = (
     "err",
     "recv",
-    "verify",
+    "validate",
     "references",
     "user_dict",
     "create_string",
     "message_dict",
     "room_dict",
-    "find_room_for",
 )
 
+T = TypeVar("T")
+
 
 class EndHandshake(Exception):
     """Exception to end the current handshake without killing the connection."""
 
 
-async def find_room_for(room_id: int, user_id: int) -> Optional[Room]:
-    """Find a room that contains a user."""
-    return await db.room.find_first(
-        where={
-            "id": room_id,
-            "users": {
-                "some": {
-                    "id": user_id,
-                }
-            },
-        },
-    )
-
-
 def references(
     target: Any,
     *,
@@ -68,7 +57,7 @@ def create_string(length: int = 8) -> str:
     )
 
 
-def user_dict(user: User) -> dict:
+def user_dict(user: Union[User, UserRecord]) -> dict:
     """Make a public dictionary for a user object."""
     return {
         "name": user.name,
@@ -81,6 +70,7 @@ def room_dict(room: Room) -> dict:
     """Make a public dictionary for a room object."""
     res = room.__dict__
     del res["messages"]
+    del res["seq"]
     res["users"] = [user_dict(i) for i in res["users"]]
     return res
 
@@ -90,7 +80,7 @@ def message_dict(message: Message) -> dict:
     res = message.__dict__
     res["author"] = user_dict(res["author"])
 
-    for i in {"server", "server_id", "author_id"}:
+    for i in {"server", "server_id", "author_id", "updated_seq", "deleted"}:
         del res[i]
 
     res["created_at"] = res["created_at"].timestamp()
@@ -99,14 +89,14 @@ def message_dict(message: Message) -> dict:
 
 
 async def _send(
-    socket: WebSocket,
+    socket: Socket,
     message: str,
     done: bool,
     success: bool,
     data: Optional[dict] = None,
 ) -> None:
     """Send an message back to the user."""
-    await socket.send_json(
+    await socket.send(
         {
             "type": (data or {}).get("type") or "unknown",
             "message": message,
@@ -117,7 +107,7 @@ async def _send(
 
 
 async def err(
-    socket: WebSocket,
+    socket: Socket,
     message: str,
     data: Optional[dict] = None,
 ) -> NoReturn:
@@ -126,49 +116,31 @@ async def err(
     raise EndHandshake
 
 
-async def verify(
-    socket: WebSocket,
+async def validate(
+    socket: Socket,
     origin: dict,
-    data: Dict[str, type],
-) -> List[Any]:
-    """Validate a received object."""
-    keys = data.keys()
-    success: bool = all([origin.get(i) is not None for i in keys])
-
-    if not success:
-        missing: str = ", ".join(
-            [i for i in keys if origin.get(i) is None],
-        )
-        await err(socket, f"Payload missing keys: {missing}", origin)
-
-    for key, ntype in data.items():
-        value = origin[key]
-
-        if not isinstance(value, ntype):
-            await err(
-                socket,
-                f'"{key}" got wrong type: expected {ntype.__name__}, got {type(value).__name__}',
-            )
-
-    return [origin[i] for i in data]
+    struct: Type[T],
+) -> T:
+    """Validate a received object against a request struct."""
+    try:
+        return schema_of(struct).validate(origin)
+    except InvalidPayload as e:
+        # only missing keys report the type header, like they always have
+        await err(socket, e.message, origin if e.missing else None)
 
 
 async def recv(
-    socket: WebSocket,
-    schema_data: Optional[Dict[str, type]] = None,
-) -> Dict[str, Any]:
+    socket: Socket,
+    struct: Type[T] = Handshake,  # type: ignore
+) -> Tuple[Dict[str, Any], T]:
     """Receive, parse, and validate an object received through the WebSocket connection."""
-    schema = schema_data or {}
-    schema["type"] = str
-
     try:
-        data: dict = json.loads(await socket.receive_text())
-    except json.JSONDecodeError:
-        await err(socket, "Invalid JSON object.")
+        data: dict = socket.codec.decode(await socket.receive())
+    except ValueError:
+        await err(socket, socket.codec.invalid_message)
 
     if data.get("end"):
         await _send(socket, "Ended handshake.", True, True)
         raise EndHandshake
 
-    await verify(socket, data, schema)
-    return data
+    return data, await validate(socket, data, struct)
@@ -1,24 +1,41 @@
-from typing import Any, Dict, List, NoReturn, Optional
+import asyncio
+import time
+from contextlib import suppress
+from typing import (
+    TYPE_CHECKING, NoReturn, Optional, Set, Type, TypeVar, Union, overload
+)
 
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
 from prisma.models import User
 from prisma.types import UserInclude
 
+from .admission import admission
+from .codec import JSON, Codec, Raw
+from .config import OUTBOUND_QUEUE_SIZE, SLOW_CONSUMER_POLICY
 from .db import db
-from .utils import err, recv, verify
+from .frames import Frame
+from .ratelimit import RateLimiter, limits
+from .reaper import reaper
+from .users import UserRecord, users
+from .utils import err, recv, validate
+
+if TYPE_CHECKING:
+    from .rooms import RoomManager
 
 __all__ = (
     "SocketHandshake",
     "Socket",
 )
 
+T = TypeVar("T")
+
 
 class SocketHandshake:
     """Class for handling a WebSocket handshake."""
 
     def __init__(self, socket: "Socket", payload: dict) -> None:
         self._socket = socket
-        self._ws = socket.connection
+        self._replied: Optional[float] = None
         self._reload(payload)
 
     @property
@@ -36,6 +53,11 @@ class SocketHandshake:
         """Type header of the current payload."""
         return self._type
 
+    @property
+    def replied(self) -> Optional[float]:
+        """When the first response was sent or queued, by `time.perf_counter`."""
+        return self._replied
+
     async def _ensure_logged(self) -> None:
         if not self.socket.user_id:
             await self.error(
@@ -44,34 +66,20 @@ class SocketHandshake:
 
     async def expect(
         self,
-        schema: Dict[str, type],
+        struct: Type[T],
         *,
         ensure_logged: bool = False,
-    ) -> List[Any]:
-        """Get a JSON value from the socket handshake."""
+    ) -> T:
+        """Validate the current payload against a request struct."""
         if ensure_logged:
             await self._ensure_logged()
 
-        return await verify(self._ws, self._payload, schema)
-
-    async def expect_only(
-        self,
-        schema: Dict[str, type],
-        *,
-        ensure_logged: bool = False,
-    ) -> Any:
-        """Get a single JSON value from the socket handshake."""
-        return (
-            await self.expect(
-                schema,
-                ensure_logged=ensure_logged,
-            )
-        )[0]
+        return await validate(self._socket, self._payload, struct)
 
     async def error(self, message: str) -> NoReturn:
         """Send an error back to the client."""
         await err(
-            self._ws,
+            self._socket,
             message,
             self._payload,
         )
@@ -85,17 +93,17 @@ class SocketHandshake:
 
     async def receive_next(
         self,
-        schema: Dict[str, type],
+        struct: Type[T],
         *,
         ensure_logged: bool = False,
-    ) -> List[Any]:
+    ) -> T:
         """Receive the next message in the handshake."""
         if ensure_logged:
             await self._ensure_logged()
 
-        payload = await recv(self._ws, schema)
+        payload, data = await recv(self._socket, struct)
         self._reload(payload)
-        return [payload[i] for i in schema if i != "type"]
+        return data
 
     def _reload(self, payload: dict) -> None:
         self._payload: dict = payload
@@ -110,7 +118,38 @@ class SocketHandshake:
         message: Optional[str] = None,
     ):
         """Send a response to the client."""
-        res = {
+        await self._socket.send(
+            self._make_reply(success, done, payload, message),
+        )
+
+    def queue_reply(
+        self,
+        *,
+        success: bool = True,
+        done: bool = False,
+        payload: Optional[dict] = None,
+        message: Optional[str] = None,
+    ) -> bool:
+        """Queue a response to the client without waiting for it to be sent."""
+        return self._socket.push(
+            self._make_reply(success, done, payload, message),
+        )
+
+    def queue_frame(self, frame: Frame) -> bool:
+        """Queue a pre-encoded frame without waiting for it to be sent."""
+        return self._socket.push(frame.render(self._type, self._socket.codec))
+
+    def _make_reply(
+        self,
+        success: bool,
+        done: bool,
+        payload: Optional[dict],
+        message: Optional[str],
+    ) -> dict:
+        if self._replied is None:
+            self._replied = time.perf_counter()
+
+        return {
             "type": self._type,
             "done": done,
             "message": message,
@@ -118,8 +157,6 @@ class SocketHandshake:
             **(payload or {}),
         }
 
-        await self._ws.send_json(res)
-
     async def finalize(
         self,
         *,
@@ -156,18 +193,31 @@ class SocketHandshake:
 
         return uid
 
+    @overload
+    async def get_user(self, *, include: None = None) -> UserRecord:
+        ...
+
+    @overload
+    async def get_user(self, *, include: UserInclude) -> User:
+        ...
+
     async def get_user(
         self,
         *,
         include: Optional[UserInclude] = None,
-    ) -> User:
-        """Get the current authenticated user ID."""
-        user = await db.user.find_unique(
-            {
-                "id": await self.get_user_id(),
-            },
-            include,
-        )
+    ) -> Union[User, UserRecord]:
+        """Get the current authenticated user.
+
+        Without `include`, the user is taken from the user cache.
+        """
+        uid = await self.get_user_id()
+        user: Union[User, UserRecord, None]
+
+        if include:
+            user = await db.user.find_unique({"id": uid}, include)
+        else:
+            user = await users.get(uid)
+
         assert user  # again, just making mypy happy
 
         return user
@@ -178,7 +228,17 @@ class Socket:
 
     def __init__(self, ws: WebSocket) -> None:
         self._ws = ws
+        self._codec: Codec = JSON
         self._user_id: Optional[int] = None
+        self._outbound: "asyncio.Queue[Union[dict, Raw]]" = asyncio.Queue(
+            maxsize=OUTBOUND_QUEUE_SIZE,
+        )
+        self._writer: Optional[asyncio.Task] = None
+        self._closing: bool = False
+        self._dropped: int = 0
+        self._limiter: RateLimiter = limits.create()
+        self._rooms: Set["RoomManager"] = set()
+        self._last_seen: float = time.monotonic()
 
     @property
     def user_id(self) -> Optional[int]:
@@ -187,19 +247,149 @@ class Socket:
 
     @user_id.setter
     def user_id(self, id: Optional[int]) -> None:
+        if self._user_id is not None:
+            admission.release_user(self._user_id)
+
+        if id is not None:
+            admission.add_user(id)
+
         self._user_id = id
 
     async def accept(self) -> SocketHandshake:
         """Accept an incoming handshake request."""
-        return SocketHandshake(self, await recv(self._ws))
+        payload, _ = await recv(self)
+        return SocketHandshake(self, payload)
 
     async def close(self) -> None:
         """Close the socket."""
+        self._closing = True
         await self._ws.close()
 
-    async def connect(self):
-        """Connect to the client."""
-        await self._ws.accept()
+    async def connect(self, codec: Codec = JSON):
+        """Connect to the client using the negotiated codec."""
+        self._codec = codec
+        await self._ws.accept(subprotocol=codec.subprotocol)
+        self._writer = asyncio.create_task(self._write_loop())
+        reaper.add(self)
+
+    async def cleanup(self) -> None:
+        """Stop the outbound writer."""
+        self._closing = True
+        reaper.discard(self)
+        self.user_id = None
+
+        if self._writer:
+            self._writer.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._writer
+
+    @property
+    def codec(self) -> Codec:
+        """Codec negotiated with the client."""
+        return self._codec
+
+    async def send(self, data: dict) -> None:
+        """Encode and send data to the client."""
+        await self._send_raw(self._codec.encode(data))
+
+    async def _send_raw(self, raw: Raw) -> None:
+        if isinstance(raw, bytes):
+            await self._ws.send_bytes(raw)
+        else:
+            await self._ws.send_text(raw)
+
+    async def receive(self) -> Raw:
+        """Receive a raw frame from the client."""
+        message = await self._ws.receive()
+        self._last_seen = time.monotonic()
+
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+
+        text = message.get("text")
+        return text if text is not None else message.get("bytes") or b""
+
+    def push(self, data: Union[dict, Raw]) -> bool:
+        """Queue data to be sent to the client.
+
+        Strings and bytes are treated as already encoded with the codec of
+        this socket.
+
+        Returns whether the data was queued. When the outbound queue is full,
+        the slow consumer policy is applied instead.
+        """
+        if self._closing:
+            return False
+
+        try:
+            self._outbound.put_nowait(data)
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+            if SLOW_CONSUMER_POLICY == "disconnect":
+                self._closing = True
+                asyncio.create_task(self._force_close())
+
+            return False
+
+        return True
+
+    def reap(self) -> None:
+        """Remove the socket from every room and close it."""
+        self._closing = True
+
+        for room in list(self._rooms):
+            room.discard(self)
+
+        asyncio.create_task(self._force_close())
+
+    async def _force_close(self) -> None:
+        # the client may already be gone, so any error here is irrelevant
+        with suppress(Exception):
+            await self._ws.close()
+
+    async def _write_loop(self) -> None:
+        while True:
+            data = await self._outbound.get()
+
+            try:
+                await self._send_raw(
+                    self._codec.encode(data) if isinstance(data, dict) else data,
+                )
+            except Exception:
+                # the connection is dead, the receiver will notice on its own
+                self._closing = True
+                return
+
+    @property
+    def dropped(self) -> int:
+        """Number of outbound frames dropped for this connection."""
+        return self._dropped
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of outbound frames waiting to be sent."""
+        return self._outbound.qsize()
+
+    @property
+    def closed(self) -> bool:
+        """Whether the socket is closed or being closed."""
+        return self._closing
+
+    @property
+    def last_seen(self) -> float:
+        """Monotonic time of the last frame received from the client."""
+        return self._last_seen
+
+    @property
+    def rooms(self) -> Set["RoomManager"]:
+        """Rooms the socket is connected to."""
+        return self._rooms
+
+    @property
+    def limiter(self) -> RateLimiter:
+        """Rate limiter of this connection."""
+        return self._limiter
 
     @property
     def connection(self) -> WebSocket: